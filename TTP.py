@@ -1,12 +1,12 @@
 from helper import *
+from TTP_cache import *
 import numpy as np
+import functools
 
 # Generate all possible matchups of teams
+# The matchups are taken from the table cache, so they are only built once per n
 def generate_matchups(n, matchups):
-    for i in range(n):
-        for j in range(n):
-            if i != j:
-                matchups.append((i, j))
+    matchups.extend(get_matchups(n))
     # Matchups are shuffled to prevent a certain order of teams from occuring every time
     np.random.shuffle(matchups)
 
@@ -19,11 +19,16 @@ def prevent_back_to_back(m, prev_round):
 
 
 # Function to generate the home/away (streak) count for each team
+# The counts at the start of a schedule are the same for every run of n teams, so they are only made once per n
 def generate_streak_count(n, streaks):
-    matches = n-1
+    streaks.update(start_streak_count(n))
+
 
-    for i in range(n):
-        streaks[i] = (matches, matches, (0, "home"))
+# Returns the home/away games left and the streak of each team at the start of a schedule, by team
+@functools.lru_cache(maxsize=None)
+def start_streak_count(n):
+    matches = n-1
+    return tuple((i, (matches, matches, (0, "home"))) for i in range(n))
 
 
 # Checks if a future streak violation will occur for each team in the current matchup
@@ -75,18 +80,24 @@ def update_streaks(m, streaks):
         streaks[m[1]] = (streaks[m[1]][0], streaks[m[1]][1]-1, (1, "away"))
 
 
+# Places the normalized first round (0, 1), (2, 3), ... at the end of the schedule
+# The matchups of the first round are removed from the matchups and the streaks are updated, all in place
+def normalize_first_round(n, matchups, streaks, schedule):
+    for i in range(0, n, 2):
+        schedule.append((i, i+1))
+        matchups.remove((i, i+1))
+        update_streaks((i, i+1), streaks)
+
+
 # Generate all possible normalized schedules given all possible rounds
 def generate_normalized_schedules(n, matchups, streaks, schedules, args, schedule=[]):
     first_round = []
 
     # Order the first round in the schedule to normalize it
-    for i in range(0, n, 2):
-        first_round.append((i, i+1))
-        matchups.remove((i, i+1))
-        update_streaks((i, i+1), streaks)
+    normalize_first_round(n, matchups, streaks, first_round)
 
     # Generate all possible schedules given this normalized first round
-    generate_schedules(n, matchups, streaks, schedules, args, first_round)
+    search(n, matchups, streaks, schedules, args, first_round)
 
 
 # Checks if a team in the current matchup is already playing in the current round
@@ -99,7 +110,146 @@ def check_repeat(m, current):
     return False
 
 
+# Returns the rounds before and after the current round of a schedule, as in check_constraints
+def split_rounds(schedule, n):
+    index = len(schedule) % (n//2)
+    current = schedule[-index:] if index > 0 else []
+    if len(schedule) >= n//2:
+        prev_round = schedule[-index-(n//2):-index] if index != 0 else schedule[-index-(n//2):]
+    else:
+        prev_round = []
+    return prev_round, current
+
+
+# Checks if the free teams of a round can still be paired by remaining matchups which pass the constraints
+# Matchups in a round are ordered by home team, so the home teams have to come after the last home team
+def check_round_completable(schedule, streaks, n, remaining):
+    if not remaining:
+        return False
+
+    prev_round, current = split_rounds(schedule, n)
+    busy = {t for p in current for t in p}
+    free = [t for t in range(n) if t not in busy]
+    last = current[-1][0] if current else -1
+
+    pairs = set()
+    for m in remaining:
+        if m[0] in busy or m[1] in busy or m[0] < last:
+            continue
+        if (m[1], m[0]) in prev_round or prevent_four_in_a_row(m, streaks) or check__future_streak_violation(m, streaks):
+            continue
+        pairs.add(m)
+        pairs.add((m[1], m[0]))
+
+    return not can_pair(free, pairs)
+
+
+# Checks if the teams can be split into pairs, all in the given set of pairs
+# The lowest team is paired with every possible opponent, as in add_rounds
+def can_pair(teams, pairs):
+    if not teams:
+        return True
+
+    t = teams[0]
+    for u in teams[1:]:
+        if (t, u) in pairs and can_pair([v for v in teams[1:] if v != u], pairs):
+            return True
+    return False
+
+
+# Checks if every team can still play its remaining opponents without playing the same opponent in two rounds in a row
+# A team plays each round, so its games left are played in consecutive rounds, starting with the next round it plays in
+# The opponent it played last can't be next, and neither can the same opponent come twice in a row
+def check_opponents_feasible(schedule, streaks, n, remaining):
+    prev_round, current = split_rounds(schedule, n)
+    last = {}
+    for p in prev_round + current:
+        last[p[0]] = p[1]
+        last[p[1]] = p[0]
+
+    games = {t: {} for t in range(n)}
+    for m in remaining:
+        games[m[0]][m[1]] = games[m[0]].get(m[1], 0) + 1
+        games[m[1]][m[0]] = games[m[1]].get(m[0], 0) + 1
+
+    for t in range(n):
+        last_games = games[t].pop(last.get(t), 0)
+        doubles = sum(1 for c in games[t].values() if c == 2)
+        singles = len(games[t]) - doubles
+        if not can_order_opponents(doubles, singles, last_games):
+            return True
+    return False
+
+
+# Checks if games against doubles opponents with two games left and singles opponents with one game left can be
+# ordered without the same opponent twice in a row, if the opponent played last has last_games games left
+@functools.lru_cache(maxsize=None)
+def can_order_opponents(doubles, singles, last_games):
+    if doubles == 0 and singles == 0:
+        return last_games == 0
+
+    # Play an opponent other than the last one, which then becomes the last opponent
+    rest = (doubles + (last_games == 2), singles + (last_games == 1))
+    if doubles > 0 and can_order_opponents(rest[0] - 1, rest[1], 1):
+        return True
+    if singles > 0 and can_order_opponents(rest[0], rest[1] - 1, 0):
+        return True
+    return False
+
+
+# Lookahead checks which can be added to check_constraints, to prune branches in which no schedule can be completed
+# Each check gets the schedule and streaks after placing a matchup and the remaining matchups,
+# and returns True if no schedule can be completed. Other modules can add their checks to this dict
+PRUNING_CHECKS = {
+    "round": check_round_completable,
+    "opponents": check_opponents_feasible,
+}
+
+# The checks run by check_constraints, and the number of matchups pruned by each of them
+ACTIVE_PRUNING = []
+PRUNE_COUNT = {}
+
+
+# Sets the lookahead checks run by check_constraints and resets their counters
+def set_pruning(names):
+    ACTIVE_PRUNING[:] = names if names else []
+    PRUNE_COUNT.clear()
+    for name in ACTIVE_PRUNING:
+        PRUNE_COUNT[name] = 0
+
+
+# Adds the counters of another search, e.g. of a parallel task, to the counters of the lookahead checks
+def add_prune_count(counts):
+    for name, count in counts.items():
+        PRUNE_COUNT[name] = PRUNE_COUNT.get(name, 0) + count
+
+
+# Prints the number of matchups pruned by each lookahead check
+def print_prune_count():
+    for name, count in PRUNE_COUNT.items():
+        print(f"Pruned by {name}: {count}")
+
+
+# Runs the active lookahead checks on the schedule after placing matchup m, the checks run in the given order
+# The remaining matchups are all matchups which are not in the schedule yet
+# Returns the name of the first check which prunes the matchup, or False
+def check_pruning(schedule, streaks, n, m):
+    new_schedule = schedule + [m]
+    new_streaks = streaks.copy()
+    update_streaks(m, new_streaks)
+
+    played = set(new_schedule)
+    remaining = [(i, j) for i in range(n) for j in range(n) if i != j and (i, j) not in played]
+
+    for name in ACTIVE_PRUNING:
+        if PRUNING_CHECKS[name](new_schedule, new_streaks, n, remaining):
+            PRUNE_COUNT[name] += 1
+            return name
+    return False
+
+
 # Function to check if a schedule meets the constraints
+# Returns False if matchup m can be played, otherwise the name of the first check it fails
 def check_constraints(schedule, streaks, n, m):
     # Gets the index to find the matchups in the current round
     index = len(schedule) % (n//2)
@@ -111,19 +261,23 @@ def check_constraints(schedule, streaks, n, m):
 
     # Checks if a team is playing in the current round
     if check_repeat(m, current):
-        return True
+        return "check_repeat"
 
     # If the current team is playing the same team back-to-back, skip this round
     if prevent_back_to_back(m, prev_round) if prev_round else False:
-        return True
+        return "prevent_back_to_back"
 
     # If the last three rounds have a team playing at home or away three times in a row, skip this round
     if prevent_four_in_a_row(m, streaks):
-        return True
+        return "prevent_four_in_a_row"
     
     # If the current matchup creates a future streak violation, skip this round
     if check__future_streak_violation(m, streaks):
-        return True
+        return "check__future_streak_violation"
+
+    # If a lookahead check finds no schedule can be completed after this matchup, skip this round
+    if ACTIVE_PRUNING:
+        return check_pruning(schedule, streaks, n, m)
 
     return False
 
@@ -151,6 +305,10 @@ def generate_schedules(n, matchups, streaks, schedules, args, schedule=[]):
     if len(schedules) == args.max or get_count() == args.max:
         return
 
+    # Record the node if the search is instrumented
+    if STATS != None:
+        STATS.visit(len(schedule))
+
     # If there are no more matchups, the schedule is complete
     if len(matchups) == 0:
         counter()
@@ -163,7 +321,10 @@ def generate_schedules(n, matchups, streaks, schedules, args, schedule=[]):
         if len(schedules) == args.max or get_count() == args.max:
             return
         # Checks if a team plays back to back or a team is on the road or at home more than three times in a row
-        if check_constraints(schedule, streaks, n, m):
+        reason = check_constraints(schedule, streaks, n, m)
+        if reason:
+            if STATS != None:
+                STATS.reject(reason)
             continue
 
         new_matchups = [new_m for new_m in matchups if new_m != m]
@@ -176,6 +337,30 @@ def generate_schedules(n, matchups, streaks, schedules, args, schedule=[]):
         generate_schedules(n, new_matchups, new_streaks, schedules, args, new_schedule)
 
 
+# Statistics of the recursive search, set with set_stats, None when the search is not instrumented
+STATS = None
+
+
+# Sets the object which records the nodes and rejections of generate_schedules, e.g. a SearchStats, or None
+def set_stats(stats):
+    global STATS
+    STATS = stats
+
+
+# Search engines which can be selected with args.engine
+# All engines take the same arguments as generate_schedules and find the same schedules in the same order
+# Other modules add their engines to this dict
+ENGINES = {"recursive": generate_schedules}
+
+# Engines which only count the schedules, so they can't print, save or stop after a maximum number of schedules
+COUNT_ENGINES = []
+
+
+# Generate all possible schedules with the engine selected in args.engine
+def search(n, matchups, streaks, schedules, args, schedule=[]):
+    ENGINES[args.engine](n, matchups, streaks, schedules, args, schedule)
+
+
 # Function to generate valid TTP schedules
 def generate_TTP(n, args=None):
     schedules = []
@@ -185,21 +370,46 @@ def generate_TTP(n, args=None):
     # Create the folder path if save is provided
     # We don't do this when random is provided because
     # otherwise the folder is created and overwitten each time
-    if args.save != None and args.random == None and not args.append:
+    if args.save != None and args.random == None and not args.append and not args.resume:
         init_save(n, args)
 
     # Generate all possible matchups given n teams
-    generate_matchups(n, matchups)
+    # When resuming, the matchups are put in the same order as in the checkpointed run
+    # and the count and schedule file are restored to their state at the checkpoint
+    if args.resume:
+        checkpoint = load_checkpoint(n)
+        matchups = checkpoint["matchups"]
+        schedules.extend(checkpoint["schedules"])
+        add_count(checkpoint["count"])
+        if args.save != None:
+            truncate_save(n, args, checkpoint["save_size"])
+    else:
+        generate_matchups(n, matchups)
 
     # Fills the streaks dict with the number of home/away games for each team
     # and the number of back-to-back games counter
     generate_streak_count(n, streaks)
 
+    # Set the lookahead checks of check_constraints
+    set_pruning(args.prune)
+
+    # Start the statistics of an instrumented search, which estimate the size of the search tree
+    if STATS != None:
+        STATS.start(n, matchups, streaks, args.normalize)
+
+    # Open the schedule file once for the whole run, unless it is already opened by handle_random
+    opened = open_writer(n, args) if args.save != None else False
+
     # Generate all possible schedules given all possible rounds
-    if args.normalize:
-        generate_normalized_schedules(n, matchups, streaks, schedules, args)
-    else:
-        generate_schedules(n, matchups, streaks, schedules, args)
+    # The writer is also closed when the run is interrupted, so no buffered schedules are lost
+    try:
+        if args.normalize:
+            generate_normalized_schedules(n, matchups, streaks, schedules, args)
+        else:
+            search(n, matchups, streaks, schedules, args)
+    finally:
+        if opened:
+            close_writer()
 
     # Print the schedules if verbose is provided
     if args.verbose != None:
@@ -209,21 +419,27 @@ def generate_TTP(n, args=None):
     if args.count != None and args.verbose == None:
         print(f"Final schedule count ({n} teams): {get_count()}")
         save_count(n, args, prefix="")
+
+    # Print the number of matchups pruned by each lookahead check
+    if args.count != None and args.prune:
+        print_prune_count()
+
+    # Print the summary of an instrumented search
+    if STATS != None:
+        STATS.report(final=True)
     
+    # The run is finished, so there is nothing left to resume
+    if args.checkpoint != None or args.resume:
+        remove_checkpoint(n)
+
     # Reset the counter in case of consecutive runs
     reset_count()
 
 
-# Function to handle the random argument
+# Generates random schedules by restarting generate_TTP with a new matchup order for every schedule
 # Simply uses generate_TTP to generate one random schedule by setting max to 1
 # This is repeated random times, to generate a set of random schedules
-def handle_random(n, args):
-    # Create the folder path if save is provided
-    # We do this now to prevent the folder from being
-    # overwritten each time generate_TTP is called
-    if args.save != None and not args.append:
-        init_save(n, args)
-
+def sample_restart(n, args):
     # Set max to 1 to generate one schedule at a time
     # This is why args.max can't be used for random schedules
     args.max = 1
@@ -236,6 +452,30 @@ def handle_random(n, args):
         generate_TTP(n, args)
 
 
+# Samplers which can be selected with args.sampler to generate random schedules
+# Other modules add their samplers to this dict
+SAMPLERS = {"restart": sample_restart}
+
+
+# Function to handle the random argument
+# Generates random schedules with the sampler selected in args.sampler
+def handle_random(n, args):
+    # Create the folder path if save is provided
+    # We do this now to prevent the folder from being
+    # overwritten each time generate_TTP is called
+    if args.save != None and not args.append:
+        init_save(n, args)
+
+    # The schedule file is opened once for all random schedules
+    if args.save != None:
+        open_writer(n, args)
+
+    try:
+        SAMPLERS[args.sampler](n, args)
+    finally:
+        close_writer()
+
+
 # Main function takes care of random sampling or normal TTP generation
 def main(n, args=None):
     if args.random != None:
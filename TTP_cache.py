@@ -0,0 +1,96 @@
+import numpy as np
+import functools
+import os
+
+# Folder in which the tables are cached on disk, set with set_cache_folder
+# None keeps the tables in memory only, so nothing is written unless a folder is given
+CACHE_FOLDER = None
+
+# Version of the cached tables, increase it when a builder changes so files of older versions are not loaded
+CACHE_VERSION = 1
+
+# Tables which are already loaded or built in this process, by (n, name)
+TABLES = {}
+
+
+# All matchups of n teams as an array of (home, away) rows, in the order of generate_matchups before shuffling
+def build_pairs(n):
+    return np.array([(i, j) for i in range(n) for j in range(n) if i != j], dtype=np.int8)
+
+
+# Lookup of the id of each matchup of n teams, the row of the matchup in the pairs table, by [home, away]
+# The diagonal, where a team would play itself, is -1
+def build_pair_ids(n):
+    pairs = get_table(n, "pairs")
+    ids = np.full((n, n), -1, dtype=np.int32)
+    ids[pairs[:, 0], pairs[:, 1]] = np.arange(len(pairs))
+    return ids
+
+
+# Id of the reverse of each matchup of n teams, (away, home) for matchup (home, away)
+def build_reverse(n):
+    pairs = get_table(n, "pairs")
+    return get_table(n, "pair_ids")[pairs[:, 1], pairs[:, 0]]
+
+
+# Functions which build a table for n teams, as a numpy array
+# Other modules add their tables to this dict
+TABLE_BUILDERS = {
+    "pairs": build_pairs,
+    "pair_ids": build_pair_ids,
+    "reverse": build_reverse,
+}
+
+
+# Sets the folder in which the tables are cached on disk, or None to keep them in memory only
+def set_cache_folder(folder):
+    global CACHE_FOLDER
+    CACHE_FOLDER = folder
+
+
+# Generate the path of the cached table with the given name for n teams
+def table_path(n, name, prefix=""):
+    return prefix + CACHE_FOLDER + "/" + name + "_" + str(n) + ".v" + str(CACHE_VERSION) + ".npy"
+
+
+# Returns the table with the given name for n teams
+# The table is taken from memory if it was used before in this process, then from the cache on disk if a cache folder
+# is set, and otherwise it is built, and saved to the cache folder if there is one
+# The tables are shared, so they are read-only
+# The file is replaced in one step, so processes building the same table at the same time don't read a partial file
+def get_table(n, name, prefix=""):
+    table = TABLES.get((n, name))
+    if table is not None:
+        return table
+
+    path = table_path(n, name, prefix) if CACHE_FOLDER != None else None
+    if path != None and os.path.exists(path):
+        table = np.load(path)
+    else:
+        table = TABLE_BUILDERS[name](n)
+
+        if path != None:
+            folder = os.path.dirname(path)
+            if not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+
+            tmp_path = path + "." + str(os.getpid()) + ".tmp"
+            with open(tmp_path, "wb") as file:
+                np.save(file, table)
+            os.replace(tmp_path, path)
+
+    table.flags.writeable = False
+    TABLES[(n, name)] = table
+    return table
+
+
+# Returns all matchups of n teams as a new list of tuples, in the order of the pairs table
+# The tuples are made from the pairs table once per n, every call only copies the list
+def get_matchups(n):
+    return list(matchup_tuples(n))
+
+
+# All matchups of n teams as a tuple of tuples, made from the pairs table
+@functools.lru_cache(maxsize=None)
+def matchup_tuples(n):
+    return tuple((i, j) for i, j in get_table(n, "pairs").tolist())
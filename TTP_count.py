@@ -0,0 +1,153 @@
+from TTP import *
+from helper import *
+from TTP_state import *
+from collections import OrderedDict
+import itertools
+import math
+
+# Default maximum number of states in the cache of subtree counts, the least recently used states are evicted first
+MEMO_CACHE_SIZE = 1 << 20
+
+# Maximum number of relabellings tried to find the canonical form of a state
+# States with more relabellings left after refining the teams are cached under their own labels
+MAX_RELABELLINGS = 5040
+
+
+# Counts the schedules below a search state without enumerating them
+# At the start of every round the state is determined by the remaining matchups, the streaks and the previous round,
+# so the number of schedules below it is cached under that key and reused when another partial schedule reaches it
+class MemoCounter:
+    def __init__(self, state, cache_size=MEMO_CACHE_SIZE, canonical=False):
+        self.state = state
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.canonical = canonical
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the key of the state at the start of a round, in the ids of the search state
+    def state_key(self):
+        state = self.state
+        r = len(state.schedule) // state.half
+        previous = state.round_matchups[r-1] if r > 0 else 0
+        return (state.remaining, tuple(state.streak), previous)
+
+    # Returns the labellings of the teams to try for the canonical form, as lists mapping each team to its new label
+    # Teams are refined by their streak, games left and the same of their opponent in the previous round,
+    # which don't depend on the labels, and only the orders of the teams within a class are tried
+    def relabellings(self, previous):
+        state = self.state
+        signature = [(state.streak[t], state.home_left[t], state.away_left[t]) for t in range(state.n)]
+        opponent = {}
+        for i in previous:
+            opponent[state.home[i]] = (1, signature[state.away[i]])
+            opponent[state.away[i]] = (-1, signature[state.home[i]])
+
+        refined = [(signature[t], opponent.get(t)) for t in range(state.n)]
+        classes = [[t for t in range(state.n) if refined[t] == key] for key in sorted(set(refined))]
+
+        total = 1
+        for teams in classes:
+            total *= math.factorial(len(teams))
+        if total > MAX_RELABELLINGS:
+            return [list(range(state.n))]
+
+        labellings = []
+        for orders in itertools.product(*[itertools.permutations(teams) for teams in classes]):
+            label = [0] * state.n
+            for new, t in enumerate(itertools.chain(*orders)):
+                label[t] = new
+            labellings.append(label)
+        return labellings
+
+    # Returns the key of the state at the start of a round which is the same for every relabelling of the teams
+    # Matchups are encoded as bits home * n + away of the relabelled teams, and the smallest encoding is the key
+    def canonical_key(self):
+        state = self.state
+        n = state.n
+        r = len(state.schedule) // state.half
+        remaining = SearchState.candidates(state)
+        previous = state.schedule[(r-1) * state.half:r * state.half] if r > 0 else []
+
+        best = None
+        for label in self.relabellings(previous):
+            streak = [0] * n
+            for t in range(n):
+                streak[label[t]] = state.streak[t]
+
+            key = (sum(1 << (label[state.home[i]] * n + label[state.away[i]]) for i in remaining), tuple(streak),
+                   sum(1 << (label[state.home[i]] * n + label[state.away[i]]) for i in previous))
+            if best == None or key < best:
+                best = key
+        return best
+
+    # Counts the schedules below the state at the start of a round, using the cache
+    def count_rounds(self):
+        state = self.state
+        if state.remaining == 0:
+            return 1
+
+        key = self.canonical_key() if self.canonical else self.state_key()
+        count = self.cache.get(key)
+        if count != None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return count
+
+        self.misses += 1
+        count = self.count_round()
+
+        self.cache[key] = count
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return count
+
+    # Counts the schedules below a state in the middle of a round, by completing the round matchup by matchup
+    def count_round(self):
+        state = self.state
+        count = 0
+
+        for i in state.candidates():
+            if state.check(i):
+                continue
+
+            state.apply(i)
+            if state.remaining == 0 or len(state.schedule) % state.half == 0:
+                count += self.count_rounds()
+            else:
+                count += self.count_round()
+            state.undo()
+
+        return count
+
+    # Counts the schedules below the state, which may start in the middle of a round
+    def count(self):
+        if len(self.state.schedule) % self.state.half == 0:
+            return self.count_rounds()
+        return self.count_round()
+
+    # Prints the hit rate and the size of the cache
+    def print_stats(self):
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0
+        print(f"Cache hits: {self.hits} of {lookups} lookups ({rate:.2%}), {len(self.cache)} states cached, {self.evictions} evicted")
+
+
+# Counts all possible schedules with the memoized engine, same arguments as generate_schedules
+# The schedules are only counted, so they can't be printed or saved
+def generate_schedules_memo(n, matchups, streaks, schedules, args, schedule=[]):
+    state = IndexedSearchState(n, matchups, streaks, schedule)
+    cache_size = args.cache_size if args.cache_size != None else MEMO_CACHE_SIZE
+    memo = MemoCounter(state, cache_size, args.canonical)
+
+    add_count(memo.count())
+
+    if args.count != None:
+        memo.print_stats()
+
+
+ENGINES["memo"] = generate_schedules_memo
+COUNT_ENGINES.append("memo")
@@ -0,0 +1,339 @@
+from TTP import *
+from helper import *
+from parallel_TTP import *
+from TTP_state import *
+from TTP_rounds import *
+from TTP_count import *
+from TTP_symmetry import *
+from TTP_iter import *
+from multiprocessing import Process
+from multiprocessing.connection import Listener, Client, AuthenticationError, deliver_challenge, answer_challenge
+from collections import deque
+import argparse
+import os
+import secrets
+import socket
+import struct
+import sys
+import threading
+import time
+
+# Environment variable from which the coordinator and the workers read the key if --authkey isn't given
+# There is no default key, the messages are pickled, so anyone with the key can run code on the coordinator and workers
+AUTHKEY_ENV = "TTP_AUTHKEY"
+
+# Number of seconds a worker keeps trying to connect to a coordinator which isn't listening yet
+CONNECT_TIMEOUT = 60
+
+# Size in bytes after which a worker sends its buffered schedules to the coordinator
+STREAM_BUFFER_SIZE = 1 << 20
+
+# Number of seconds between the heartbeats a worker sends while it searches a task
+HEARTBEAT_INTERVAL = 5
+
+# Number of seconds without any message after which the coordinator considers a worker with a task lost
+WORKER_TIMEOUT = 60
+
+# Number of seconds a connecting worker has to authenticate before the coordinator drops its connection
+HANDSHAKE_TIMEOUT = 10
+
+
+# Returns the given key, or the key in the environment variable AUTHKEY_ENV if no key is given, or None if neither is set
+def get_authkey(authkey=None):
+    return authkey if authkey != None else os.environ.get(AUTHKEY_ENV)
+
+
+# Parses an address of the form host:port
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return (host if host else "localhost", int(port))
+
+
+# Sets the number of seconds after which a receive on the socket of a connection fails, 0 waits forever
+# The timeout is set on the socket itself, as the connection reads the socket directly and can't use a non-blocking socket
+def set_receive_timeout(conn, timeout):
+    if sys.platform == "win32":
+        value = struct.pack("L", int(timeout * 1000))
+    else:
+        value = struct.pack("ll", int(timeout), int(timeout % 1 * 1000000))
+
+    with socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, value)
+
+
+# Connection of a worker to the coordinator, which can be used by the search and the heartbeat thread at the same time
+class WorkerConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        with self.lock:
+            self.conn.send(message)
+
+    def recv(self):
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Sends a heartbeat for a task to the coordinator every HEARTBEAT_INTERVAL seconds until stop is set
+# A long task is not mistaken for a lost worker, and a worker which hangs or is cut off stops sending them
+def send_heartbeats(conn, index, stop):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            conn.send(("heartbeat", index))
+        except OSError:
+            return
+
+
+# Sends the schedules of a task to the coordinator instead of writing them to a file
+# Same interface as ScheduleWriter, the schedules are encoded in the format of the schedule file and sent in blocks
+class StreamWriter:
+    def __init__(self, conn, index, n, format="csv", buffer_size=STREAM_BUFFER_SIZE):
+        self.conn = conn
+        self.index = index
+        self.lines = []
+        self.size = 0
+        self.buffer_size = buffer_size
+        self.labels, self.separator, self.end = schedule_encoding(n, format)
+
+    def write(self, schedule):
+        line = self.separator.join([self.labels[m] for m in schedule]) + self.end
+        self.lines.append(line)
+        self.size += len(line)
+
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.conn.send(("schedules", self.index, b"".join(self.lines)))
+        self.lines = []
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+
+# Searches the subtree of one task in a worker, the schedules are sent to the coordinator if they are saved
+# Returns the number of schedules found, the first verbose schedules and the counters of the lookahead checks
+def run_remote_task(conn, n, index, item, args):
+    matchups, streaks, schedule = item
+    schedules = []
+
+    task_args = argparse.Namespace(**vars(args))
+    task_args.count = None
+
+    if args.save != None:
+        set_writer(StreamWriter(conn, index, n, args.format))
+
+    stop = threading.Event()
+    threading.Thread(target=send_heartbeats, args=(conn, index, stop), daemon=True).start()
+
+    # The worker caches the tables in the cache folder of the run, relative to its own working folder
+    set_cache_folder(args.table_cache)
+    reset_count()
+    set_pruning(args.prune)
+    try:
+        search(n, matchups, streaks, schedules, task_args, schedule)
+    finally:
+        stop.set()
+        close_writer()
+
+    count = get_count()
+    reset_count()
+    return count, schedules, PRUNE_COUNT
+
+
+# Connects to the coordinator and searches the tasks it hands out until it tells the worker to stop
+# The worker retries to connect for CONNECT_TIMEOUT seconds, so it can be started before the coordinator
+def run_worker(address, authkey):
+    start_time = time.time()
+    while True:
+        try:
+            conn = WorkerConnection(Client(address, authkey=authkey.encode()))
+            break
+        except ConnectionRefusedError:
+            if time.time() - start_time > CONNECT_TIMEOUT:
+                raise
+            time.sleep(0.5)
+
+    # The worker stops when the coordinator closes the connection
+    with conn:
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "stop":
+                    return
+
+                _, n, index, item, args = message
+                count, schedules, prune_count = run_remote_task(conn, n, index, item, args)
+                conn.send(("done", index, count, schedules, prune_count))
+        except (EOFError, OSError):
+            return
+
+
+# Hands out the tasks of a distributed run to the workers which connect to it, like generate_schedules_mpi_dynamic
+# in parallel_TTP.cpp. Every worker gets a new task as soon as it finishes one, so fast workers take more tasks
+# A worker is lost when its connection closes or it sends nothing for timeout seconds while it has a task,
+# its task is then handed out again and its partial schedules are discarded
+# The coordinator keeps running for all n, so the workers stay connected between the runs of consecutive n
+# Without a key, a random key is generated and printed, the workers have to be started with this key
+# The workers authenticate in their own thread, so a client which drops or stalls during the handshake only loses its connection
+class Coordinator:
+    def __init__(self, address, authkey=None, timeout=WORKER_TIMEOUT):
+        authkey = get_authkey(authkey)
+        if authkey == None:
+            authkey = secrets.token_hex(16)
+            print(f"Start the workers with {AUTHKEY_ENV}={authkey} python TTP_distributed.py {address[0]}:{address[1]}")
+
+        self.authkey = authkey.encode()
+        self.listener = Listener(address)
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.pending = deque()
+        self.results = {}
+        self.tasks = []
+        self.stopped = False
+
+        threading.Thread(target=self.accept_workers, daemon=True).start()
+
+    # Accepts the connections of new workers, each worker is served by its own thread
+    # A connection which fails while it is accepted is skipped, the loop only ends when the listener is closed
+    def accept_workers(self):
+        while not self.stopped:
+            try:
+                conn = self.listener.accept()
+            except (EOFError, ConnectionError):
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self.serve_worker, args=(conn,), daemon=True).start()
+
+    # Authenticates a new worker in both directions, as Listener.accept does with a key
+    # Raises AuthenticationError for a wrong key, and EOFError or OSError if the worker drops or takes longer than HANDSHAKE_TIMEOUT
+    def authenticate(self, conn):
+        set_receive_timeout(conn, HANDSHAKE_TIMEOUT)
+        deliver_challenge(conn, self.authkey)
+        answer_challenge(conn, self.authkey)
+        set_receive_timeout(conn, 0)
+
+    # Waits for a task which isn't searched yet, returns None when the coordinator is stopped
+    def next_task(self):
+        with self.condition:
+            while not self.pending and not self.stopped:
+                self.condition.wait()
+            if self.stopped:
+                return None
+            return self.pending.popleft()
+
+    # Sends tasks to one worker and collects their results, the schedules of a task are written to its part file
+    def serve_worker(self, conn):
+        index = None
+        part = None
+        try:
+            self.authenticate(conn)
+
+            while True:
+                index = self.next_task()
+                if index == None:
+                    conn.send(("stop",))
+                    return
+
+                n, item, args = self.tasks[index]
+                part = open(generate_part_path(n, args, index), "wb") if args.save != None else None
+                conn.send(("task", n, index, item, args))
+
+                while True:
+                    if not conn.poll(self.timeout):
+                        raise TimeoutError
+                    message = conn.recv()
+                    if message[0] == "heartbeat":
+                        continue
+                    if message[0] == "schedules":
+                        part.write(message[2])
+                        continue
+
+                    _, _, count, schedules, prune_count = message
+                    break
+
+                if part != None:
+                    part.close()
+                    part = None
+
+                with self.condition:
+                    self.results[index] = (count, schedules, prune_count)
+                    index = None
+                    self.condition.notify_all()
+
+        except (EOFError, OSError, AuthenticationError):
+            # The worker is lost or timed out, so its task is handed out again first
+            if part != None:
+                part.close()
+            with self.condition:
+                if index != None:
+                    print(f"Worker lost, task {index} is handed out again")
+                    self.pending.appendleft(index)
+                self.condition.notify_all()
+
+        finally:
+            conn.close()
+
+    # Hands out the tasks of n teams and yields their results in task order, each as soon as it and all tasks before it are done
+    def run_tasks(self, n, tasks, args):
+        with self.condition:
+            self.tasks = [(n, item, args) for item in tasks]
+            self.results = {}
+            self.pending.extend(range(len(tasks)))
+            self.condition.notify_all()
+
+        for i in range(len(tasks)):
+            with self.condition:
+                while i not in self.results:
+                    self.condition.wait()
+                result = self.results.pop(i)
+            yield result
+
+    # Tells the workers to stop and stops accepting new workers
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        self.listener.close()
+
+
+# Function to generate valid TTP schedules with the workers of a coordinator, as generate_TTP_parallel does with a pool
+def generate_TTP_distributed(n, args, coordinator):
+    generate_TTP_tasks(n, args, coordinator.run_tasks)
+
+
+# Starts a number of worker processes on this machine, which connect to the coordinator at the given address
+def start_workers(address, authkey, processes=1):
+    workers = [Process(target=run_worker, args=(address, authkey)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run workers for a distributed TTP run, started with run.py --coordinator")
+    parser.add_argument("address", type=str, help="Address of the coordinator, as host:port")
+    parser.add_argument("-p", "--processes", type=int, default=1, help="Number of worker processes to start")
+    parser.add_argument("--authkey", type=str, help="Key with which the workers authenticate to the coordinator, printed by the coordinator. Read from " + AUTHKEY_ENV + " if not given")
+    args = parser.parse_args()
+
+    authkey = get_authkey(args.authkey)
+    if authkey == None:
+        print("The workers need the key of the coordinator, with --authkey or " + AUTHKEY_ENV)
+        sys.exit(1)
+
+    start_workers(parse_address(args.address), authkey, args.processes)
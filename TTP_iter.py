@@ -0,0 +1,67 @@
+from TTP import *
+from helper import *
+from TTP_state import *
+import itertools
+import numpy as np
+
+
+# Yields all schedules below a search state, with the steps of search_stack but without the count, args or schedule list
+# The search only advances when the next schedule is asked for, so a consumer can stop early
+# Every schedule is yielded as a new list of matchups, the state is restored when the generator is closed
+def iter_state(state):
+    if state.remaining == 0:
+        yield state.get_schedule()
+        return
+
+    base = len(state.schedule)
+    stack = [[state.candidates(), 0]]
+
+    try:
+        while stack:
+            schedule = step_stack(state, stack)
+            if schedule != None:
+                yield schedule
+    finally:
+        while len(state.schedule) > base:
+            state.undo()
+
+
+# Yields the valid schedules of n teams one at a time, without any global state
+# The matchups are shuffled with a generator seeded with seed, so the same seed gives the same schedules in the same order
+# If normalize is True, only the schedules with the first round (0, 1), (2, 3), ... are yielded
+# If limit is provided, at most limit schedules are yielded
+def iter_schedules(n, normalize=False, limit=None, seed=None):
+    rng = np.random.default_rng(seed)
+    matchups = [(i, j) for i in range(n) for j in range(n) if i != j]
+    rng.shuffle(matchups)
+
+    streaks = {}
+    generate_streak_count(n, streaks)
+
+    # Order the first round in the schedule to normalize it, as in generate_normalized_schedules
+    schedule = []
+    if normalize:
+        normalize_first_round(n, matchups, streaks, schedule)
+
+    state = IndexedSearchState(n, matchups, streaks, schedule)
+    schedules = iter_state(state)
+    if limit != None:
+        schedules = itertools.islice(schedules, limit)
+
+    yield from schedules
+
+
+# Generate all possible schedules with the lazy engine, same arguments and results as generate_schedules
+# The engine is a consumer of iter_state, which counts, stores and saves the schedules it yields
+def generate_schedules_lazy(n, matchups, streaks, schedules, args, schedule=[]):
+    state = IndexedSearchState(n, matchups, streaks, schedule)
+
+    for s in iter_state(state):
+        if len(schedules) == args.max or get_count() == args.max:
+            break
+
+        counter()
+        handle_complete_schedule(n, s, schedules, args)
+
+
+ENGINES["lazy"] = generate_schedules_lazy
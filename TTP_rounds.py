@@ -0,0 +1,156 @@
+from TTP import *
+from helper import *
+from TTP_state import *
+from TTP_cache import *
+import numpy as np
+
+
+# Adds all rounds which can be made by pairing the free teams to the matchups already in the round
+# The lowest free team is paired with every other free team, both at home and on the road
+def add_rounds(free, round, rounds):
+    if not free:
+        rounds.append(sorted(round))
+        return
+
+    t = free[0]
+    for u in free[1:]:
+        rest = [v for v in free[1:] if v != u]
+        add_rounds(rest, round + [(t, u)], rounds)
+        add_rounds(rest, round + [(u, t)], rounds)
+
+
+# Generate all perfect matchings of the teams with a home/away orientation, i.e. all possible rounds
+# Each round is a list of matchups ordered by home team, the order check_repeat puts a round in
+def generate_rounds(n):
+    rounds = []
+    add_rounds(list(range(n)), [], rounds)
+    return rounds
+
+
+# Table of all possible rounds of n teams, as an array with one row of (home, away) matchups per round
+def build_rounds(n):
+    return np.array(generate_rounds(n), dtype=np.int8)
+
+
+# Table of all possible rounds of n teams, as an array with one row of matchup ids of the pairs table per round
+def build_round_ids(n):
+    rounds = get_table(n, "rounds")
+    return get_table(n, "pair_ids")[rounds[:, :, 0], rounds[:, :, 1]]
+
+
+# Table of all possible rounds for a search state, as an array of matchup ids with one row per round
+# The rounds are loaded from the table cache and their matchup ids are mapped to the ids of the state
+# The rows are sorted by the ids of their matchups, which is the order in which
+# the matchup-level search finds the rounds, so both find the schedules in the same order
+def generate_round_table(state):
+    ids = state.state_ids[get_table(state.n, "round_ids")]
+    order = np.lexsort(ids.T[::-1])
+    return ids[order]
+
+
+# Returns whether a team can play at home, and whether it can play on the road in the next round
+# These are the streak checks of prevent_four_in_a_row and check__future_streak_violation, for arrays of teams
+def team_streak_checks(home_left, away_left, streak):
+    # Playing at home, with one home game less left
+    x = np.maximum(home_left - 1, away_left)
+    y = np.minimum(home_left - 1, away_left)
+    s = np.where((streak > 0) & (home_left - 1 > away_left), streak, 0)
+    home_ok = (streak != 3) & (x + s <= 3 * (y + 1))
+
+    # Playing on the road, with one away game less left
+    x = np.maximum(home_left, away_left - 1)
+    y = np.minimum(home_left, away_left - 1)
+    s = np.where((streak < 0) & (away_left - 1 > home_left), -streak, 0)
+    away_ok = (streak != -3) & (x + s <= 3 * (y + 1))
+
+    return home_ok, away_ok
+
+
+# Table of the streak checks of a team of n teams by [home games left, away games left, streak]
+# The last axis holds whether the team can play at home and whether it can play on the road
+# Streaks go from -3 to 3, negative streaks are at the end of their axis, so the streaks of a state index it directly
+def build_streak_checks(n):
+    home_left, away_left, streak = np.meshgrid(np.arange(n), np.arange(n), np.arange(7) - 7 * (np.arange(7) > 3), indexing="ij")
+    return np.stack(team_streak_checks(home_left, away_left, streak), axis=-1)
+
+
+# Returns the rows of the round table which can be played next, in table order
+# The given rows only contain remaining matchups, a round can be played if none of its matchups
+# is the reverse of a matchup in the previous round and no team in it violates a streak constraint
+# The streak checks of the teams are looked up in the streak table, which is cheaper than computing them per node
+def valid_rounds(state, table, rows, home, away, reverse):
+    ok = get_table(state.n, "streaks")[state.home_left, state.away_left, state.streak]
+    valid = ok[home, 0] & ok[away, 1]
+
+    if state.schedule:
+        valid[reverse[state.schedule[-state.half:]]] = False
+
+    return rows[valid[table[rows]].all(axis=1)]
+
+
+# Returns the given rows of the round table which do not share a matchup with round k
+# A table of n teams has n/2 matchups per row and n*(n-1) matchup ids, so the table isn't scanned for the largest id
+def remove_round(table, rows, k):
+    n = 2 * table.shape[1]
+    used = np.zeros(n * (n-1), dtype=bool)
+    used[table[k]] = True
+    return rows[~used[table[rows]].any(axis=1)]
+
+
+# Generate all possible schedules by extending the schedule one full round at a time
+# rows holds the rows of the round table of which all matchups are remaining
+# A partial round at the start is completed matchup by matchup, as in search_state
+def search_rounds(state, table, rows, schedules, args, home, away, reverse):
+    if len(schedules) == args.max or get_count() == args.max:
+        return
+
+    if state.remaining == 0:
+        counter()
+        handle_complete_schedule(state.n, state.get_schedule(), schedules, args)
+        return
+
+    if len(state.schedule) % state.half != 0:
+        for i in state.candidates():
+            if len(schedules) == args.max or get_count() == args.max:
+                return
+            if state.check(i):
+                continue
+
+            state.apply(i)
+            search_rounds(state, table, remaining_rows(state, table), schedules, args, home, away, reverse)
+            state.undo()
+        return
+
+    for k in valid_rounds(state, table, rows, home, away, reverse):
+        if len(schedules) == args.max or get_count() == args.max:
+            return
+
+        for i in table[k]:
+            state.apply(int(i))
+        search_rounds(state, table, remove_round(table, rows, k), schedules, args, home, away, reverse)
+        for _ in range(state.half):
+            state.undo()
+
+
+# Returns the rows of the round table of which all matchups are remaining in the search state
+def remaining_rows(state, table):
+    remaining = np.array([state.remaining >> i & 1 for i in range(len(state.pairs))], dtype=bool)
+    return np.flatnonzero(remaining[table].all(axis=1))
+
+
+# Generate all possible schedules with the round-level engine, same arguments and results as generate_schedules
+def generate_schedules_rounds(n, matchups, streaks, schedules, args, schedule=[]):
+    state = SearchState(n, matchups, streaks, schedule)
+    table = generate_round_table(state)
+
+    home = np.array(state.home)
+    away = np.array(state.away)
+    reverse = np.array(state.reverse)
+
+    search_rounds(state, table, remaining_rows(state, table), schedules, args, home, away, reverse)
+
+
+TABLE_BUILDERS["rounds"] = build_rounds
+TABLE_BUILDERS["round_ids"] = build_round_ids
+TABLE_BUILDERS["streaks"] = build_streak_checks
+ENGINES["rounds"] = generate_schedules_rounds
@@ -0,0 +1,205 @@
+from TTP import *
+from helper import *
+from TTP_state import *
+import numpy as np
+
+
+# Number of nodes a randomized backtracking descent may visit before it restarts from the root
+RESTART_NODES = 10000
+
+# Number of descents used to estimate the largest weight before uniform sampling starts
+WARMUP_DESCENTS = 20
+
+# Margin on the largest warmup weight, as a log factor, so later descents rarely exceed the bound
+WEIGHT_MARGIN = np.log(2)
+
+# Maximum number of states kept in the cache of dead ends before it is cleared
+ALIVE_CACHE_SIZE = 1 << 20
+
+
+# Samples random schedules from one search state, which is reused for every draw
+# The matchups, the streaks and the candidate index are only built once, and each draw
+# only applies and undoes moves on top of the (normalized) first round
+class ScheduleSampler:
+    def __init__(self, n, normalize=False):
+        matchups = []
+        streaks = {}
+        schedule = []
+
+        generate_matchups(n, matchups)
+        generate_streak_count(n, streaks)
+
+        # Place the normalized first round, as in generate_normalized_schedules
+        if normalize:
+            normalize_first_round(n, matchups, streaks, schedule)
+
+        self.state = IndexedSearchState(n, matchups, streaks, schedule)
+        self.base = len(self.state.schedule)
+        self.alive_cache = {}
+
+        # Statistics of the draws, a descent is a walk from the root to a complete schedule
+        self.descents = 0
+        self.accepted = 0
+        self.restarts = 0
+        self.log_bound = None
+        self.bound_raised = 0
+
+    # Returns the valid candidate matchups of the current state
+    def valid_candidates(self):
+        return [i for i in self.state.candidates() if not self.state.check(i)]
+
+    # Returns a key which identifies the subtree below the current state
+    # The games left follow from the remaining matchups, so the key holds the remaining matchups,
+    # the streaks and the matchups of the previous and the current round, as the next round is checked against them
+    def state_key(self):
+        state = self.state
+        p = len(state.schedule)
+        r = p // state.half
+        previous = state.round_matchups[r-1] if r > 0 else 0
+        last = state.home[state.schedule[-1]] if p % state.half != 0 else -1
+        return (state.remaining, tuple(state.streak), previous, state.round_matchups[r], last)
+
+    # Checks whether at least one complete schedule can be reached from the current state
+    # This is a depth-first search which stops at the first complete schedule, dead ends are cached
+    def alive(self):
+        state = self.state
+        if state.remaining == 0:
+            return True
+
+        key = self.state_key()
+        result = self.alive_cache.get(key)
+        if result != None:
+            return result
+
+        result = False
+        for i in self.valid_candidates():
+            state.apply(i)
+            result = self.alive()
+            state.undo()
+            if result:
+                break
+
+        if len(self.alive_cache) >= ALIVE_CACHE_SIZE:
+            self.alive_cache.clear()
+        self.alive_cache[key] = result
+        return result
+
+    # Undoes all moves on top of the first round
+    def reset(self):
+        while len(self.state.schedule) > self.base:
+            self.state.undo()
+
+    # Draws a schedule with a randomized depth-first search, the candidates of every depth are shuffled
+    # After RESTART_NODES nodes the search restarts from the root, so it doesn't get stuck in a large dead subtree
+    # This is fast, but schedules in small subtrees are found more often than others
+    def sample_backtrack(self):
+        state = self.state
+
+        while True:
+            self.descents += 1
+            stack = [[np.random.permutation(self.valid_candidates()), 0]]
+            nodes = 0
+
+            while stack and nodes < RESTART_NODES:
+                frame = stack[-1]
+                ids, pos = frame
+
+                # All candidates of this depth are done, backtrack
+                if pos == len(ids):
+                    stack.pop()
+                    if stack:
+                        state.undo()
+                    continue
+
+                frame[1] = pos + 1
+                state.apply(int(ids[pos]))
+                nodes += 1
+
+                if state.remaining == 0:
+                    schedule = state.get_schedule()
+                    self.reset()
+                    self.accepted += 1
+                    return schedule
+
+                stack.append([np.random.permutation(self.valid_candidates()), 0])
+
+            self.reset()
+            self.restarts += 1
+
+    # Walks from the root to a complete schedule, choosing uniformly among the children which are not dead ends
+    # A schedule is reached with probability 1 / w, where w is the product of the number of children on the way,
+    # returns the schedule and log(w)
+    def descend(self):
+        state = self.state
+        log_weight = 0.0
+        self.descents += 1
+
+        while state.remaining != 0:
+            ids = []
+            for i in self.valid_candidates():
+                state.apply(i)
+                if self.alive():
+                    ids.append(i)
+                state.undo()
+
+            log_weight += np.log(len(ids))
+            state.apply(ids[np.random.randint(len(ids))])
+
+        schedule = state.get_schedule()
+        self.reset()
+        return schedule, log_weight
+
+    # Draws a uniformly random schedule with rejection sampling on the descents
+    # A descent is accepted with probability w / W, so every schedule has the same probability 1 / W
+    # The bound W is estimated from WARMUP_DESCENTS descents, and raised whenever a descent exceeds it,
+    # in which case the samples before it are only near-uniform
+    def sample_uniform(self):
+        if self.log_bound == None:
+            self.log_bound = max(self.descend()[1] for _ in range(WARMUP_DESCENTS)) + WEIGHT_MARGIN
+
+        while True:
+            schedule, log_weight = self.descend()
+
+            if log_weight > self.log_bound:
+                self.log_bound = log_weight
+                self.bound_raised += 1
+
+            if np.log(np.random.random()) < log_weight - self.log_bound:
+                self.accepted += 1
+                return schedule
+
+    # Prints the number of descents per accepted schedule and the restarts or bound changes
+    def print_stats(self, sampler):
+        rate = self.accepted / self.descents if self.descents else 0
+        print(f"Acceptance rate: {rate:.4f} ({self.accepted} schedules in {self.descents} descents)")
+
+        if sampler == "backtrack":
+            print(f"Restarts: {self.restarts}")
+        else:
+            print(f"Times the weight bound was raised: {self.bound_raised}")
+
+
+# Generates args.random schedules with a ScheduleSampler, instead of restarting generate_TTP for each schedule
+def sample_schedules_TTP(n, args):
+    sampler = ScheduleSampler(n, args.normalize)
+    draw = sampler.sample_uniform if args.sampler == "uniform" else sampler.sample_backtrack
+    schedules = []
+
+    for i in range(args.random):
+        if args.count != None and args.count != 0 and i % args.count == 0:
+            print("Current schedule count:", i)
+
+        counter()
+        handle_complete_schedule(n, draw(), schedules, args)
+
+    if args.verbose != None:
+        print_schedules(n, schedules)
+
+    if args.count != None:
+        sampler.print_stats(args.sampler)
+
+    reset_count()
+
+
+SAMPLERS["backtrack"] = sample_schedules_TTP
+SAMPLERS["uniform"] = sample_schedules_TTP
@@ -0,0 +1,336 @@
+from TTP import *
+from helper import *
+import numpy as np
+import timeit
+
+
+# Compact search state, in which moves are applied and undone in place
+# Each matchup gets an id, the remaining matchups are a bitset over these ids
+# Home/away games left and the streaks of the teams are kept in flat integer lists
+# A streak is positive for games played at home in a row and negative for games played on the road in a row
+# The ids follow the order of the matchups list, which is shuffled, and the cached tables number the matchups in
+# the order of the pairs table, so the ids of the tables are mapped to the ids of the state once per state
+class SearchState:
+    def __init__(self, n, matchups, streaks, schedule=[]):
+        self.n = n
+        self.half = n//2
+
+        # The remaining matchups get the lowest ids, so iterating over the bitset follows their order
+        self.pairs = [m for m in matchups] + [m for m in schedule]
+        self.ids = {m: i for i, m in enumerate(self.pairs)}
+        self.home = [m[0] for m in self.pairs]
+        self.away = [m[1] for m in self.pairs]
+
+        # state_ids[k] is the id in this state of the matchup with id k in the cached tables
+        table_ids = get_table(n, "pair_ids")[self.home, self.away]
+        self.state_ids = np.empty(len(self.pairs), dtype=np.intp)
+        self.state_ids[table_ids] = np.arange(len(self.pairs))
+        self.reverse = self.state_ids[get_table(n, "reverse")[table_ids]].tolist()
+        self.remaining = (1 << len(matchups)) - 1
+
+        self.home_left = [streaks[t][0] for t in range(n)]
+        self.away_left = [streaks[t][1] for t in range(n)]
+        self.streak = [streaks[t][2][0] if streaks[t][2][1] == "home" else -streaks[t][2][0] for t in range(n)]
+
+        # Bitsets of the matchups and of the teams that are played in each round
+        num_rounds = len(self.pairs) // self.half
+        self.round_matchups = [0] * num_rounds
+        self.round_teams = [0] * num_rounds
+
+        self.schedule = []
+        self.undo_streaks = []
+        for m in schedule:
+            self.place(self.ids[m])
+
+    # Places matchup i in the schedule, without updating the streaks and the games left
+    def place(self, i):
+        r = len(self.schedule) // self.half
+        self.schedule.append(i)
+        self.round_matchups[r] |= 1 << i
+        self.round_teams[r] |= (1 << self.home[i]) | (1 << self.away[i])
+
+    # Checks if matchup i violates a constraint, the same checks as check_constraints
+    def check(self, i):
+        a = self.home[i]
+        b = self.away[i]
+        p = len(self.schedule)
+        r = p // self.half
+
+        # Checks if a team is playing in the current round, and orders the round by the home team
+        if p % self.half != 0 and (self.round_teams[r] >> a & 1 or self.round_teams[r] >> b & 1 or a < self.home[self.schedule[-1]]):
+            return True
+
+        return self.check_matchup(i)
+
+    # Checks the constraints of matchup i that do not depend on the other matchups in the current round
+    def check_matchup(self, i):
+        a = self.home[i]
+        b = self.away[i]
+        r = len(self.schedule) // self.half
+
+        # Checks if the teams played each other in the previous round
+        if r > 0 and self.round_matchups[r-1] >> self.reverse[i] & 1:
+            return True
+
+        # Checks if a team would play at home or on the road four times in a row
+        if self.streak[a] == 3 or self.streak[b] == -3:
+            return True
+
+        # Checks for a future streak violation, (x + s) / 3 <= y + 1 for both teams
+        home_left = self.home_left[a] - 1
+        away_left = self.away_left[a]
+        s = self.streak[a] if self.streak[a] > 0 and home_left > away_left else 0
+        if max(home_left, away_left) + s > 3 * (min(home_left, away_left) + 1):
+            return True
+
+        home_left = self.home_left[b]
+        away_left = self.away_left[b] - 1
+        s = -self.streak[b] if self.streak[b] < 0 and away_left > home_left else 0
+        if max(home_left, away_left) + s > 3 * (min(home_left, away_left) + 1):
+            return True
+
+        return False
+
+    # Applies matchup i to the state
+    def apply(self, i):
+        a = self.home[i]
+        b = self.away[i]
+
+        self.undo_streaks.append((self.streak[a], self.streak[b]))
+        self.place(i)
+        self.remaining &= ~(1 << i)
+        self.home_left[a] -= 1
+        self.away_left[b] -= 1
+        self.streak[a] = self.streak[a] + 1 if self.streak[a] >= 0 else 1
+        self.streak[b] = self.streak[b] - 1 if self.streak[b] <= 0 else -1
+
+    # Undoes the last applied matchup
+    def undo(self):
+        i = self.schedule.pop()
+        a = self.home[i]
+        b = self.away[i]
+        r = len(self.schedule) // self.half
+
+        self.round_matchups[r] &= ~(1 << i)
+        self.round_teams[r] &= ~((1 << a) | (1 << b))
+        self.remaining |= 1 << i
+        self.home_left[a] += 1
+        self.away_left[b] += 1
+        self.streak[a], self.streak[b] = self.undo_streaks.pop()
+
+    # Returns the ids of the remaining matchups, in the order of the matchups list
+    def candidates(self):
+        ids = []
+        mask = self.remaining
+        while mask:
+            low = mask & -mask
+            ids.append(low.bit_length() - 1)
+            mask ^= low
+        return ids
+
+    # Returns the current schedule as a list of matchups
+    def get_schedule(self):
+        return [self.pairs[i] for i in self.schedule]
+
+
+# Search state which looks up the candidate matchups of the current round in a precomputed index
+# The index maps the teams already playing in the round and the last home team to the matchups
+# which can still be added to the round, so check_repeat no longer has to scan the round
+class IndexedSearchState(SearchState):
+    def __init__(self, n, matchups, streaks, schedule=[]):
+        super().__init__(n, matchups, streaks, schedule)
+        self.index = {}
+
+    # Builds the candidate matchups, in id order, for the teams busy in the round and the last home team
+    # Matchups in a round are ordered by home team, so every free team with a lower index than the
+    # home team of a candidate has to play on the road later in the round. A candidate is left out if
+    # there are more of those teams than matchups left to fill in the round, as the round can't be completed
+    def build_candidates(self, busy, last):
+        slots_left = self.half - bin(busy).count("1") // 2 - 1
+        ids = []
+
+        for i in range(len(self.pairs)):
+            a = self.home[i]
+            b = self.away[i]
+            if busy >> a & 1 or busy >> b & 1 or a < last:
+                continue
+
+            free_below = ~busy & ~(1 << b) & ((1 << a) - 1)
+            if bin(free_below).count("1") > slots_left:
+                continue
+
+            ids.append(i)
+
+        return ids
+
+    # Returns the ids of the remaining matchups which fit in the current round
+    def candidates(self):
+        p = len(self.schedule)
+        if p % self.half == 0:
+            key = (0, -1)
+        else:
+            key = (self.round_teams[p // self.half], self.home[self.schedule[-1]])
+
+        ids = self.index.get(key)
+        if ids == None:
+            ids = self.build_candidates(*key)
+            self.index[key] = ids
+
+        remaining = self.remaining
+        return [i for i in ids if remaining >> i & 1]
+
+    # The candidates already satisfy check_repeat, so only the other constraints are checked
+    def check(self, i):
+        return self.check_matchup(i)
+
+
+# Generate all possible schedules by applying and undoing moves on a SearchState
+def search_state(state, schedules, args):
+    # If the maximum number of schedules has been reached, return
+    if len(schedules) == args.max or get_count() == args.max:
+        return
+
+    # If there are no more matchups, the schedule is complete
+    if state.remaining == 0:
+        counter()
+        handle_complete_schedule(state.n, state.get_schedule(), schedules, args)
+        return
+
+    for i in state.candidates():
+        # If the maximum number of schedules has been reached, return
+        if len(schedules) == args.max or get_count() == args.max:
+            return
+        if state.check(i):
+            continue
+
+        state.apply(i)
+        search_state(state, schedules, args)
+        state.undo()
+
+
+# Number of iterations of search_stack between two checks of the checkpoint timer
+CHECKPOINT_ITERATIONS = 4096
+
+
+# Creates a checkpoint of the search frontier of search_stack
+# The frontier is the position of the next candidate to try at each depth, together with the count
+# and the size of the schedule file, so a resumed run neither duplicates nor skips schedules
+def make_checkpoint(state, stack, schedules, args):
+    return {
+        "n": state.n,
+        "normalize": args.normalize,
+        "matchups": state.pairs,
+        "positions": [frame[1] for frame in stack],
+        "count": get_count(),
+        "schedules": [s for s in schedules],
+        "save_size": get_save_size(state.n, args) if args.save != None else 0,
+    }
+
+
+# Rebuilds the frames of search_stack from the positions in a checkpoint
+# The candidate matchups of each depth are found again, and the matchups being searched are applied to the state
+def restore_stack(state, positions):
+    stack = []
+
+    for depth, pos in enumerate(positions):
+        ids = state.candidates()
+        stack.append([ids, pos])
+        if depth < len(positions) - 1:
+            state.apply(ids[pos - 1])
+
+    return stack
+
+
+# Advances the iterative depth-first search on the stack by one step, the step shared by search_stack and iter_state
+# Each frame on the stack holds the candidate matchups of one depth and the position of the next candidate to try
+# Moves are applied to the state when a frame is pushed and undone when it is popped, so there is no recursion
+# Returns the schedule if the step completes one, as a new list of matchups, and None otherwise
+def step_stack(state, stack):
+    frame = stack[-1]
+    ids, pos = frame
+
+    # Skip the candidates which violate a constraint
+    while pos < len(ids) and state.check(ids[pos]):
+        pos += 1
+
+    # All candidates of this depth are done, backtrack
+    if pos == len(ids):
+        stack.pop()
+        if stack:
+            state.undo()
+        return None
+
+    frame[1] = pos + 1
+    state.apply(ids[pos])
+
+    # If there are no more matchups, the schedule is complete
+    if state.remaining == 0:
+        schedule = state.get_schedule()
+        state.undo()
+        return schedule
+
+    stack.append([state.candidates(), 0])
+    return None
+
+
+# Generate all possible schedules with an iterative depth-first search, like generate_schedules_stack in generate_TTP.cpp
+# The search advances one step_stack at a time, so the frontier can be saved between two steps
+# If args.checkpoint is provided, the frames are saved every args.checkpoint seconds and can be restored with positions
+def search_stack(state, schedules, args, positions=None):
+    if len(schedules) == args.max or get_count() == args.max:
+        return
+
+    if state.remaining == 0:
+        counter()
+        handle_complete_schedule(state.n, state.get_schedule(), schedules, args)
+        return
+
+    base = len(state.schedule)
+    stack = restore_stack(state, positions) if positions else [[state.candidates(), 0]]
+    iterations = 0
+    last_checkpoint = timeit.default_timer()
+
+    while stack:
+        # If the maximum number of schedules has been reached, undo all moves and return
+        if len(schedules) == args.max or get_count() == args.max:
+            break
+
+        # Save a checkpoint if the interval has passed, at this point all frames but the top one are applied
+        iterations += 1
+        if args.checkpoint != None and iterations % CHECKPOINT_ITERATIONS == 0:
+            if timeit.default_timer() - last_checkpoint >= args.checkpoint:
+                save_checkpoint(state.n, make_checkpoint(state, stack, schedules, args))
+                last_checkpoint = timeit.default_timer()
+
+        schedule = step_stack(state, stack)
+        if schedule != None:
+            counter()
+            handle_complete_schedule(state.n, schedule, schedules, args)
+
+    while len(state.schedule) > base:
+        state.undo()
+
+
+# Generate all possible schedules with the bitmask engine, same arguments and results as generate_schedules
+def generate_schedules_bitmask(n, matchups, streaks, schedules, args, schedule=[]):
+    state = SearchState(n, matchups, streaks, schedule)
+    search_state(state, schedules, args)
+
+
+# Generate all possible schedules with the candidate index engine, same arguments and results as generate_schedules
+def generate_schedules_indexed(n, matchups, streaks, schedules, args, schedule=[]):
+    state = IndexedSearchState(n, matchups, streaks, schedule)
+    search_state(state, schedules, args)
+
+
+# Generate all possible schedules with the iterative engine, same arguments and results as generate_schedules
+# When resuming, the search continues at the frontier stored in the checkpoint
+def generate_schedules_stack(n, matchups, streaks, schedules, args, schedule=[]):
+    state = IndexedSearchState(n, matchups, streaks, schedule)
+    positions = load_checkpoint(n)["positions"] if args.resume else None
+    search_stack(state, schedules, args, positions)
+
+
+ENGINES["bitmask"] = generate_schedules_bitmask
+ENGINES["indexed"] = generate_schedules_indexed
+ENGINES["stack"] = generate_schedules_stack
@@ -0,0 +1,111 @@
+from TTP import *
+from helper import *
+import numpy as np
+import json
+import timeit
+
+# Number of random probes of Knuth's estimator
+KNUTH_PROBES = 200
+
+# Number of nodes between two checks of the report timer
+STATS_ITERATIONS = 4096
+
+
+# Estimates the number of nodes and complete schedules below a work item (matchups, streaks, schedule)
+# with Knuth's estimator: a probe walks down the tree choosing a random valid matchup at each depth,
+# and the product of the numbers of valid matchups on the way is an unbiased estimate of the nodes at that depth
+def knuth_estimate(n, item, probes=KNUTH_PROBES, rng=None):
+    rng = rng if rng != None else np.random.default_rng()
+    matchups, streaks, schedule = item
+    nodes = 0
+    leaves = 0
+
+    # The probes also run the lookahead checks, which should not count as pruned matchups of the search
+    saved_prune_count = dict(PRUNE_COUNT)
+
+    for _ in range(probes):
+        probe_matchups = [m for m in matchups]
+        probe_streaks = streaks.copy()
+        probe_schedule = [s for s in schedule]
+        weight = 1
+        nodes += 1
+
+        while probe_matchups:
+            valid = [m for m in probe_matchups if not check_constraints(probe_schedule, probe_streaks, n, m)]
+            if not valid:
+                break
+
+            weight *= len(valid)
+            nodes += weight
+
+            m = valid[rng.integers(len(valid))]
+            probe_matchups.remove(m)
+            probe_schedule.append(m)
+            update_streaks(m, probe_streaks)
+        else:
+            leaves += weight
+
+    PRUNE_COUNT.update(saved_prune_count)
+    return nodes / probes, leaves / probes
+
+
+# Records the nodes visited per depth and the rejected matchups per check of generate_schedules
+# Every interval seconds a JSON line with the progress is printed, with the number of nodes per second
+# and the remaining time, estimated from the size of the search tree with Knuth's estimator
+class SearchStats:
+    def __init__(self, interval, probes=KNUTH_PROBES):
+        self.interval = interval
+        self.probes = probes
+
+    # Resets the statistics and estimates the size of the search tree of n teams
+    def start(self, n, matchups, streaks, normalize=False):
+        schedule = []
+        streaks = streaks.copy()
+        matchups = [m for m in matchups]
+
+        # Estimate the same tree as generate_normalized_schedules searches
+        if normalize:
+            normalize_first_round(n, matchups, streaks, schedule)
+
+        self.n = n
+        self.nodes = 0
+        self.depth_nodes = [0] * (n * (n-1) + 1)
+        self.rejections = {}
+        self.estimated_nodes, self.estimated_schedules = knuth_estimate(n, (matchups, streaks, schedule), self.probes)
+        self.start_time = timeit.default_timer()
+        self.last_report = self.start_time
+
+    # Records a node at the given depth, the number of matchups in the schedule
+    def visit(self, depth):
+        self.nodes += 1
+        self.depth_nodes[depth] += 1
+
+        if self.nodes % STATS_ITERATIONS == 0 and timeit.default_timer() - self.last_report >= self.interval:
+            self.report()
+            self.last_report = timeit.default_timer()
+
+    # Records a matchup rejected by the given check of check_constraints
+    def reject(self, reason):
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+
+    # Prints the statistics as one JSON line
+    def report(self, final=False):
+        elapsed = timeit.default_timer() - self.start_time
+        rate = self.nodes / elapsed if elapsed > 0 else 0
+        remaining = max(self.estimated_nodes - self.nodes, 0)
+
+        stats = {
+            "type": "summary" if final else "progress",
+            "n": self.n,
+            "elapsed": round(elapsed, 3),
+            "nodes": self.nodes,
+            "nodes_per_second": round(rate, 1),
+            "schedules": get_count(),
+            "depth_nodes": self.depth_nodes,
+            "rejections": self.rejections,
+            "estimated_nodes": round(self.estimated_nodes),
+            "estimated_schedules": round(self.estimated_schedules),
+            "estimated_remaining_seconds": None if final or rate == 0 else round(remaining / rate, 1),
+        }
+
+        print(json.dumps(stats), flush=True)
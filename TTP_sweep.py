@@ -0,0 +1,144 @@
+from TTP import *
+from helper import *
+from TTP_stats import *
+from TTP_state import *
+from TTP_rounds import *
+from TTP_count import *
+from TTP_symmetry import *
+from TTP_iter import *
+from multiprocessing import Pool
+import argparse
+import csv
+import os
+import timeit
+
+# Number of random probes used to estimate the cost of each n of a sweep
+SWEEP_PROBES = 50
+
+# Folder of the result tables of sweeps
+SWEEP_FOLDER = "Sweep"
+
+# Columns of the result table of a sweep
+SWEEP_COLUMNS = ["n", "count", "nodes", "estimated_nodes", "time", "schedules_per_second"]
+
+
+# Counts the nodes of generate_schedules, in place of a SearchStats when only the number of nodes is needed
+class NodeCounter:
+    def __init__(self):
+        self.nodes = 0
+
+    def start(self, n, matchups, streaks, normalize=False):
+        self.nodes = 0
+
+    def visit(self, depth):
+        self.nodes += 1
+
+    def reject(self, reason):
+        pass
+
+    def report(self, final=False):
+        pass
+
+
+# Returns the matchups, streaks and schedule at the root of the search tree of n teams
+# The first round is placed if the schedules are normalized, as in generate_normalized_schedules
+def root_item(n, normalize):
+    matchups = []
+    streaks = {}
+    schedule = []
+
+    generate_matchups(n, matchups)
+    generate_streak_count(n, streaks)
+
+    if normalize:
+        normalize_first_round(n, matchups, streaks, schedule)
+
+    return matchups, streaks, schedule
+
+
+# Estimates the number of nodes of the search tree of n teams, which is used as the expected cost of n
+def estimate_cost(n, args):
+    set_pruning(args.prune)
+    nodes, _ = knuth_estimate(n, root_item(n, args.normalize), SWEEP_PROBES)
+    return nodes
+
+
+# Counts the schedules of one n of a sweep in a worker process
+# Returns a row of the result table, the nodes are only counted by the recursive engine
+# The cache folder is set from args, as a worker which is spawned instead of forked doesn't inherit it
+def run_sweep_task(task):
+    n, estimated_nodes, args = task
+    task_args = argparse.Namespace(**vars(args))
+    task_args.count = None
+
+    set_cache_folder(args.table_cache)
+    stats = NodeCounter() if args.engine == "recursive" else None
+    set_stats(stats)
+    set_pruning(args.prune)
+    reset_count()
+
+    start_time = timeit.default_timer()
+    matchups, streaks, schedule = root_item(n, args.normalize)
+    search(n, matchups, streaks, [], task_args, schedule)
+    runtime = timeit.default_timer() - start_time
+
+    count = get_count()
+    reset_count()
+    set_stats(None)
+
+    return {
+        "n": n,
+        "count": count,
+        "nodes": stats.nodes if stats != None else None,
+        "estimated_nodes": round(estimated_nodes),
+        "time": round(runtime, 3),
+        "schedules_per_second": round(count / runtime, 1) if runtime > 0 else None,
+    }
+
+
+# Generate the path of the result table of a sweep
+def sweep_path(args, prefix=""):
+    return prefix + SWEEP_FOLDER + "/Sweep_" + str(args.n_start) + "-" + str(args.n_end) + ".csv"
+
+
+# Saves the result table of a sweep, one row per n
+def save_sweep(rows, args):
+    path = sweep_path(args)
+    folder = os.path.dirname(path)
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=SWEEP_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+# Prints the result table of a sweep
+def print_sweep(rows):
+    widths = [max(len(c), *(len(str(row[c])) for row in rows)) for c in SWEEP_COLUMNS]
+    print("  ".join(c.rjust(w) for c, w in zip(SWEEP_COLUMNS, widths)))
+    for row in rows:
+        print("  ".join(str(row[c] if row[c] != None else "-").rjust(w) for c, w in zip(SWEEP_COLUMNS, widths)))
+
+
+# Counts the schedules for every n from n_start to n_end with a pool of args.sweep worker processes
+# Each n is one task, the tasks are started in order of their estimated cost, the most expensive first,
+# so the largest n doesn't start last, and the pool has no more processes than there are tasks
+# The round tables of the engines are shared between the processes and runs through the table cache, if --table-cache is given
+def sweep_TTP(args):
+    ns = list(range(args.n_start, args.n_end + 1, 2))
+    costs = {n: estimate_cost(n, args) for n in ns}
+    tasks = [(n, costs[n], args) for n in sorted(ns, key=lambda n: costs[n], reverse=True)]
+
+    rows = []
+    with Pool(processes=min(args.sweep, len(tasks))) as pool:
+        for row in pool.imap_unordered(run_sweep_task, tasks):
+            if args.count != None:
+                print(f"Final schedule count ({row['n']} teams): {row['count']}")
+            rows.append(row)
+
+    rows.sort(key=lambda row: row["n"])
+    save_sweep(rows, args)
+    print_sweep(rows)
@@ -0,0 +1,144 @@
+from TTP import *
+from helper import *
+from TTP_state import *
+from TTP_rounds import *
+import itertools
+import math
+
+
+# Returns the relabellings of the teams which keep the normalized first round (0, 1), (2, 3), ... the same
+# These swap the matchups of the first round, but keep the home team of each matchup at home, so there are (n/2)! of them
+def first_round_relabellings(n):
+    labels = []
+    for order in itertools.permutations(range(n//2)):
+        label = [0] * n
+        for j, k in enumerate(order):
+            label[2*j] = 2*k
+            label[2*j + 1] = 2*k + 1
+        labels.append(label)
+    return labels
+
+
+# Returns the relabellings as maps from the id of a matchup in the search state to the id of the relabelled matchup
+def relabel_ids(state, labels):
+    return [[state.ids[(label[state.home[i]], label[state.away[i]])] for i in range(len(state.pairs))] for label in labels]
+
+
+# Returns the bitset of the matchups with the given ids after applying a relabelling
+def relabel_mask(ids, group_element):
+    mask = 0
+    for i in ids:
+        mask |= 1 << group_element[i]
+    return mask
+
+
+# Returns the bitset of the matchups with the given ids
+def ids_mask(ids):
+    mask = 0
+    for i in ids:
+        mask |= 1 << i
+    return mask
+
+
+# Returns the relabellings of the group which map the given matchups onto themselves
+def stabilizer(group, ids):
+    mask = ids_mask(ids)
+    return [g for g in group if relabel_mask(ids, g) == mask]
+
+
+# Returns the size of the orbit of a round under the group, or 0 if the round is not the smallest round of its orbit
+# Only the smallest round of every orbit is searched, and counted as many times as there are rounds in its orbit
+def orbit_size(group, ids):
+    mask = ids_mask(ids)
+    fixed = 0
+
+    for g in group:
+        image = relabel_mask(ids, g)
+        if image < mask:
+            return 0
+        if image == mask:
+            fixed += 1
+
+    return len(group) // fixed
+
+
+# Counts all schedules by extending the schedule one round at a time, like search_rounds
+# group holds the relabellings which keep every round of the schedule the same, as long as it has more than one element
+# the rounds which are relabellings of each other have the same number of schedules below them,
+# so only the smallest round of each orbit is searched and its schedules are counted weight times the size of the orbit
+def search_orbits(state, table, rows, group, weight, home, away, reverse):
+    if state.remaining == 0:
+        add_count(weight)
+        return
+
+    # A partial round at the start is completed matchup by matchup, the group stabilizes the full round afterwards
+    if len(state.schedule) % state.half != 0:
+        for i in state.candidates():
+            if state.check(i):
+                continue
+
+            state.apply(i)
+            new_group = group
+            if len(state.schedule) % state.half == 0 and len(group) > 1:
+                new_group = stabilizer(group, state.schedule[-state.half:])
+            search_orbits(state, table, remaining_rows(state, table), new_group, weight, home, away, reverse)
+            state.undo()
+        return
+
+    for k in valid_rounds(state, table, rows, home, away, reverse):
+        ids = [int(i) for i in table[k]]
+        new_group = group
+        new_weight = weight
+
+        if len(group) > 1:
+            size = orbit_size(group, ids)
+            if size == 0:
+                continue
+            new_group = stabilizer(group, ids)
+            new_weight = weight * size
+
+        for i in ids:
+            state.apply(i)
+        search_orbits(state, table, remove_round(table, rows, k), new_group, new_weight, home, away, reverse)
+        for _ in range(state.half):
+            state.undo()
+
+
+# Returns the relabellings which keep every (partial) round of the schedule the same
+# They are only used when the schedule starts with the normalized first round, otherwise only the identity is returned
+def schedule_symmetry(n, state, schedule):
+    first_round = [(i, i+1) for i in range(0, n, 2)]
+    if schedule[:n//2] != first_round:
+        return [list(range(len(state.pairs)))]
+
+    group = relabel_ids(state, first_round_relabellings(n))
+    for r in range(0, len(schedule), n//2):
+        group = stabilizer(group, [state.ids[m] for m in schedule[r:r + n//2]])
+    return group
+
+
+# Counts all possible schedules with symmetry reduction, same arguments as generate_schedules
+# Without a schedule, the first round is normalized and counted for all n!/(n/2)! first rounds it is a relabelling of
+# The schedules are only counted, so they can't be printed or saved
+def generate_schedules_symmetry(n, matchups, streaks, schedules, args, schedule=[]):
+    weight = 1
+    if not schedule:
+        matchups = [m for m in matchups]
+        streaks = streaks.copy()
+        schedule = []
+        normalize_first_round(n, matchups, streaks, schedule)
+        weight = math.factorial(n) // math.factorial(n//2)
+
+    state = SearchState(n, matchups, streaks, schedule)
+    table = generate_round_table(state)
+    group = schedule_symmetry(n, state, schedule)
+
+    home = np.array(state.home)
+    away = np.array(state.away)
+    reverse = np.array(state.reverse)
+
+    search_orbits(state, table, remaining_rows(state, table), group, weight, home, away, reverse)
+
+
+ENGINES["symmetry"] = generate_schedules_symmetry
+COUNT_ENGINES.append("symmetry")
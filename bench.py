@@ -0,0 +1,575 @@
+from TTP import *
+from helper import *
+from TTP_state import *
+from TTP_rounds import *
+from TTP_sampler import *
+from TTP_count import *
+from TTP_symmetry import *
+from TTP_iter import *
+from parallel_TTP import *
+from TTP_distributed import *
+from multiprocessing.connection import Client
+import TTP_state
+import calc
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import secrets
+import socket
+import sys
+import tempfile
+import threading
+import timeit
+import numpy as np
+
+# Number of teams and the maximum number of schedules to generate for each benchmark, None for all schedules
+ENGINE_BENCHMARKS = [(4, None), (6, 5000), (8, 1000)]
+
+# Benchmarks of the suite, the search benchmarks are (n, max, normalize, engine, extra arguments)
+# The full n=6 count is only feasible with a counting engine
+SUITE_SEARCH = [
+    (4, None, False, "recursive", {}),
+    (4, None, True, "recursive", {}),
+    (6, 20000, True, "recursive", {}),
+    (6, 20000, True, "stack", {}),
+    (6, None, True, "memo", {"canonical": True}),
+    (8, 1000, True, "recursive", {}),
+    (8, 1000, True, "stack", {}),
+]
+# Samplers with the number of teams and the number of random schedules
+SUITE_RANDOM = [("restart", 6, 20), ("backtrack", 6, 200), ("uniform", 6, 10)]
+# Number of teams and number of schedules in the sample file of the verifier and distance benchmarks
+SUITE_SAMPLE = (6, 2000)
+# Parameters of the beta-binomial distribution and number of draws of the fit benchmark
+SUITE_FIT = (2.0, 5.0, 60, 100000)
+# Engines compared by check_count_engines, as (name, engine, extra arguments)
+COUNT_CHECK_ENGINES = [
+    ("recursive", "recursive", {}),
+    ("stack", "stack", {}),
+    ("memo", "memo", {}),
+    ("canonical", "memo", {"canonical": True}),
+    ("symmetry", "symmetry", {}),
+]
+# Number of teams compared by check_engine_order and the maximum number of schedules of each search
+ORDER_CHECK_TEAMS = [4, 6, 8]
+ORDER_CHECK_MAX = 2000
+# Subtrees counted by check_count_engines, as (n, matchups at the start of the schedules)
+COUNT_PREFIXES = [
+    (4, []),
+    (4, [(0, 1), (2, 3)]),
+    (6, [(0, 1), (2, 3), (4, 5), (0, 3), (2, 4), (5, 1), (1, 0), (3, 2)]),
+]
+
+
+# Creates the arguments for generate_TTP, with the same defaults as run.py
+def make_args(**kwargs):
+    args = argparse.Namespace(n_start=4, n_end=None, normalize=False, append=False, verbose=None, count=None,
+                              max=None, save=None, random=None, timer=False, parallel=None, task_depth=None,
+                              engine="recursive", checkpoint=None, resume=False, format="csv", sampler="restart",
+                              canonical=False, cache_size=None, table_cache=None, prune=None, stats=None, sweep=None,
+                              coordinator=None, authkey=None, worker_timeout=60, adaptive=None)
+    for key, value in kwargs.items():
+        setattr(args, key, value)
+    return args
+
+
+# Times the search of (normalized) schedules for one engine, returns the time and the number of schedules found
+# Other arguments of the search, e.g. canonical for the memo engine, can be given as keyword arguments
+def bench_engine(n, engine, max=None, seed=0, normalize=True, **kwargs):
+    args = make_args(engine=engine, max=max, normalize=normalize, **kwargs)
+    schedules = []
+    matchups = []
+    streaks = {}
+
+    # The matchups are shuffled with the global RNG, so every engine searches the same tree
+    np.random.seed(seed)
+    generate_matchups(n, matchups)
+    generate_streak_count(n, streaks)
+
+    start_time = timeit.default_timer()
+    if normalize:
+        generate_normalized_schedules(n, matchups, streaks, schedules, args)
+    else:
+        search(n, matchups, streaks, schedules, args)
+    runtime = timeit.default_timer() - start_time
+
+    count = get_count()
+    reset_count()
+    return runtime, count
+
+
+# Compares the engines on the same search trees and prints a table with the results
+def bench_engines(engines, benchmarks=ENGINE_BENCHMARKS, seed=0):
+    print(f"{'n':>3} {'max':>6} {'engine':>10} {'count':>8} {'time':>9} {'schedules/s':>12} {'speedup':>8}")
+
+    for n, max in benchmarks:
+        base = None
+        for engine in engines:
+            runtime, count = bench_engine(n, engine, max, seed)
+            base = runtime if base == None else base
+            print(f"{n:>3} {str(max):>6} {engine:>10} {count:>8} {runtime:>8.2f}s {count / runtime:>12.0f} {base / runtime:>7.2f}x")
+
+
+# Times the search with saving off, with the schedule file reopened for every schedule, and with the buffered writer
+def bench_save(n=6, max=20000, engine="stack", seed=0):
+    print(f"{'n':>3} {'max':>6} {'saving':>9} {'time':>9} {'schedules/s':>12}")
+
+    for mode in ["off", "append", "buffered"]:
+        args = make_args(engine=engine, max=max, normalize=True, save=None if mode == "off" else "bench")
+        if args.save != None:
+            init_save(n, args)
+        if mode == "buffered":
+            open_writer(n, args)
+
+        schedules = []
+        matchups = []
+        streaks = {}
+        np.random.seed(seed)
+        generate_matchups(n, matchups)
+        generate_streak_count(n, streaks)
+
+        start_time = timeit.default_timer()
+        generate_normalized_schedules(n, matchups, streaks, schedules, args)
+        close_writer()
+        runtime = timeit.default_timer() - start_time
+
+        print(f"{n:>3} {max:>6} {mode:>9} {runtime:>8.2f}s {get_count() / runtime:>12.0f}")
+        reset_count()
+
+
+# Times the random schedules of a sampler, returns the time and the number of schedules
+def bench_random(n, sampler, random, seed=0):
+    args = make_args(random=random, sampler=sampler, normalize=True)
+    np.random.seed(seed)
+
+    start_time = timeit.default_timer()
+    SAMPLERS[sampler](n, args)
+    runtime = timeit.default_timer() - start_time
+
+    reset_count()
+    return runtime, random
+
+
+# Saves the first schedules of a seeded search to the file name in the current folder, for the calc benchmarks
+def make_sample_file(n, num_schedules, name, seed=0):
+    args = make_args(engine="stack", max=num_schedules, normalize=True, save="bench")
+    init_save(n, args)
+    open_writer(n, args)
+
+    np.random.seed(seed)
+    matchups = []
+    streaks = {}
+    generate_matchups(n, matchups)
+    generate_streak_count(n, streaks)
+    try:
+        generate_normalized_schedules(n, matchups, streaks, [], args)
+    finally:
+        close_writer()
+    reset_count()
+
+    _, _, path = generate_paths(n, args)
+    os.replace(path, name)
+
+
+# Times a function, returns the time and its result, anything it prints is discarded
+def time_quiet(function, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        start_time = timeit.default_timer()
+        result = function(*args, **kwargs)
+        runtime = timeit.default_timer() - start_time
+    return runtime, result
+
+
+# Runs the benchmark suite and returns the results, with the time, the count and the throughput of each benchmark
+# and the result of the fit
+# The calc benchmarks run in a temporary folder, on a sample file made from a seeded search
+def bench_suite(seed=0):
+    results = []
+
+    def add(name, params, runtime, count, result=None):
+        results.append({"name": name, "params": params, "time": runtime, "count": count,
+                        "per_second": count / runtime if runtime > 0 else None, "result": result})
+        print(f"{name:>12} {json.dumps(params):<60} {runtime:>8.2f}s {count:>10}")
+
+    for n, max, normalize, engine, kwargs in SUITE_SEARCH:
+        _, (runtime, count) = time_quiet(bench_engine, n, engine, max, seed, normalize, **kwargs)
+        add("search", {"n": n, "max": max, "normalize": normalize, "engine": engine, **kwargs}, runtime, count)
+
+    for sampler, n, random in SUITE_RANDOM:
+        _, (runtime, count) = time_quiet(bench_random, n, sampler, random, seed)
+        add("random", {"n": n, "sampler": sampler}, runtime, count)
+
+    n, num_schedules = SUITE_SAMPLE
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            os.makedirs("Distances")
+            make_sample_file(n, num_schedules, "sample.csv", seed)
+            params = {"n": n, "schedules": num_schedules}
+
+            # verify_schedules reads schedules written as tuples, (0, 1), (2, 3), ...
+            with open("sample-tuples.csv", "w") as file:
+                for schedule in calc.load_schedules("sample.csv", n).tolist():
+                    file.write(", ".join([str(tuple(m)) for m in schedule]) + "\n")
+
+            runtime, _ = time_quiet(calc.verify_schedules, n, "sample-tuples.csv")
+            add("verify", params, runtime, num_schedules)
+            runtime, _ = time_quiet(calc.verify_schedules_batch, n, "sample.csv")
+            add("verify_batch", params, runtime, num_schedules)
+
+            pairs = num_schedules * (num_schedules - 1) // 2
+            runtime, _ = time_quiet(calc.calc_diff, "sample.csv", n)
+            add("calc_diff", params, runtime, pairs)
+            runtime, _ = time_quiet(calc.calc_diff, "sample.csv", n, histogram=True)
+            add("calc_diff", {**params, "histogram": True}, runtime, pairs)
+        finally:
+            os.chdir(cwd)
+
+    a, b, max_diff, draws = SUITE_FIT
+    data = np.bincount(calc.betabinom.rvs(max_diff, a, b, size=draws, random_state=seed), minlength=max_diff + 1)
+    runtime, fit = time_quiet(calc.fit_beta_binom, np.arange(max_diff + 1), data, max_diff)
+    add("fit", {"a": a, "b": b, "max_diff": max_diff, "draws": draws}, runtime, 1, [float(v) for v in fit])
+
+    return results
+
+
+# Saves the results of the suite with the seed and the versions, so runs on other machines or commits can be compared
+def save_suite(results, path, seed):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path, "w") as file:
+        json.dump({
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "seed": seed,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "results": results,
+        }, file, indent=2)
+
+
+# Prints the speedup of each benchmark compared to the same benchmark in an earlier results file
+def compare_suite(results, path):
+    with open(path, "r") as file:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(file)["results"]}
+
+    print(f"{'benchmark':>12} {'params':<60} {'before':>9} {'after':>9} {'speedup':>8}")
+    for r in results:
+        params = json.dumps(r["params"], sort_keys=True)
+        before = baseline.get((r["name"], params))
+        if before == None:
+            continue
+        print(f"{r['name']:>12} {json.dumps(r['params']):<60} {before['time']:>8.2f}s {r['time']:>8.2f}s {before['time'] / r['time']:>7.2f}x")
+
+
+# Runs a function in a new temporary folder, which is removed afterwards
+def in_temp_folder(function, *args, **kwargs):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            os.chdir(cwd)
+
+
+# Checks that serial and parallel runs appended twice to a new binary file load back with all their schedules
+# Returns whether the check passed and what was found
+def check_append_bin(n=4, seed=0):
+    found = []
+
+    for parallel in [None, 2]:
+        args = make_args(save="parallel" if parallel else "serial", format="bin", append=True, parallel=parallel)
+        run = generate_TTP_parallel if parallel else generate_TTP
+        counts = []
+
+        for _ in range(2):
+            np.random.seed(seed)
+            time_quiet(run, n, args)
+            counts.append(len(calc.load_schedules(generate_paths(n, args)[2], n)))
+
+        found.append(counts)
+
+    expected = found[0][0]
+    return all(counts == [expected, 2 * expected] for counts in found), f"schedules after each append (serial, parallel): {found}"
+
+
+# Checks that the line index of a schedule file is built again after schedules are appended to the file
+# Returns whether the check passed and what was found
+def check_line_index(n=4, seed=0):
+    args = make_args(save="index", append=True)
+    path = generate_paths(n, args)[2]
+    lengths = []
+
+    for _ in range(2):
+        np.random.seed(seed)
+        time_quiet(generate_TTP, n, args)
+        lengths.append(len(calc.load_line_index(path)))
+
+    return lengths == [lengths[0], 2 * lengths[0]], f"lines in the index after each append: {lengths}"
+
+
+# Returns the first max normalized schedules of n teams found by one engine, in the order the engine finds them
+# Other arguments of the search, e.g. prune, can be given as keyword arguments
+def search_schedules(n, engine, max, seed=0, **kwargs):
+    args = make_args(engine=engine, max=max, verbose=max, normalize=True, **kwargs)
+    schedules = []
+    matchups = []
+    streaks = {}
+
+    np.random.seed(seed)
+    generate_matchups(n, matchups)
+    generate_streak_count(n, streaks)
+    set_pruning(args.prune)
+
+    generate_normalized_schedules(n, matchups, streaks, schedules, args)
+    set_pruning(None)
+    reset_count()
+    return schedules
+
+
+# Checks that every engine which enumerates the schedules finds the same schedules in the same order as the recursive engine
+def check_engine_order():
+    engines = [engine for engine in ENGINES if engine not in COUNT_ENGINES]
+    found = []
+
+    for n in ORDER_CHECK_TEAMS:
+        expected = search_schedules(n, "recursive", ORDER_CHECK_MAX)
+        same = [engine for engine in engines if search_schedules(n, engine, ORDER_CHECK_MAX) == expected]
+        found.append((n, len(expected), len(same) == len(engines), [engine for engine in engines if engine not in same]))
+
+    return all(ok for _, _, ok, _ in found), f"(n, schedules, all engines the same, engines which differ): {found}"
+
+
+# Checks that the lookahead checks only prune branches without schedules, so the schedules and their order stay the same
+def check_prune_order(n=6):
+    expected = search_schedules(n, "recursive", ORDER_CHECK_MAX)
+    pruned = search_schedules(n, "recursive", ORDER_CHECK_MAX, prune=list(PRUNING_CHECKS))
+    return pruned == expected, f"schedules without and with {list(PRUNING_CHECKS)}: {len(expected)}, {len(pruned)}, same order: {pruned == expected}"
+
+
+# Returns the schedule file and the saved count of a run of n teams
+def read_run(n, args):
+    with open(generate_paths(n, args)[2], "rb") as file:
+        schedules = file.read()
+    with open("Count/Count_" + str(n) + ".txt", "r") as file:
+        count = int(file.read())
+    return schedules, count
+
+
+# Runs a checkpointed search which is killed when it saves its second checkpoint
+# The schedules found since the first checkpoint are written first, so the resumed run has to truncate them
+def run_killed_search(n, args, seed):
+    saves = []
+
+    def save_or_kill(n, checkpoint, prefix=""):
+        if saves:
+            close_writer()
+            os._exit(1)
+        saves.append(checkpoint)
+        save_checkpoint(n, checkpoint, prefix)
+
+    TTP_state.save_checkpoint = save_or_kill
+    np.random.seed(seed)
+    time_quiet(generate_TTP, n, args)
+
+
+# Checks that a run which is killed and resumed from its checkpoint saves the same schedules and count as a run which isn't
+def check_resume(n=6, seed=0):
+    os.makedirs("Count")
+    args = make_args(engine="stack", max=ORDER_CHECK_MAX, normalize=True, count=0, save="full")
+    np.random.seed(seed)
+    time_quiet(generate_TTP, n, args)
+    expected = read_run(n, args)
+
+    args = make_args(engine="stack", max=ORDER_CHECK_MAX, normalize=True, count=0, save="resumed", checkpoint=1e-9)
+    killed = multiprocessing.Process(target=run_killed_search, args=(n, args, seed))
+    killed.start()
+    killed.join()
+    checkpoint = load_checkpoint(n)
+    unsaved = os.path.getsize(generate_paths(n, args)[2]) - checkpoint["save_size"]
+
+    args.resume = True
+    time_quiet(generate_TTP, n, args)
+    resumed = read_run(n, args)
+
+    return resumed == expected and unsaved > 0, f"count at the checkpoint: {checkpoint['count']}, bytes saved after it: {unsaved}, count (full, resumed): ({expected[1]}, {resumed[1]}), same schedules: {resumed[0] == expected[0]}"
+
+
+# Counts the schedules of n teams which start with the given matchups with one engine
+# Other arguments of the search, e.g. canonical for the memo engine, can be given as keyword arguments
+def count_prefix(n, prefix, engine, seed=0, **kwargs):
+    args = make_args(engine=engine, **kwargs)
+    matchups = []
+    streaks = {}
+
+    np.random.seed(seed)
+    generate_matchups(n, matchups)
+    generate_streak_count(n, streaks)
+
+    schedule = []
+    for m in prefix:
+        schedule.append(m)
+        matchups.remove(m)
+        update_streaks(m, streaks)
+
+    search(n, matchups, streaks, [], args, schedule)
+    count = get_count()
+    reset_count()
+    return count
+
+
+# Checks that the counting engines count as many schedules as the engines which enumerate them
+# The full n=6 count takes too long for the symmetry engine, so n=6 is checked on the fixed subtree below
+# COUNT_PREFIXES, which starts with the normalized first round and ends in the middle of the third round
+def check_count_engines():
+    found = []
+
+    for n, prefix in COUNT_PREFIXES:
+        counts = {name: count_prefix(n, prefix, engine, **kwargs) for name, engine, kwargs in COUNT_CHECK_ENGINES}
+        found.append((n, len(prefix), counts))
+
+    return all(len(set(counts.values())) == 1 for _, _, counts in found), f"(n, prefix length, counts): {found}"
+
+
+# Reads the three Distances files of a schedule file
+def read_distances(filepath):
+    distances = []
+    for path in calc.distance_paths(filepath):
+        with open(path, "r") as file:
+            distances.append(file.read())
+    return distances
+
+
+# Checks that calc_diff, calc_diff_parallel with a small memory budget and their histograms match calc_diff_python
+# on a sample file and on an empty file. The histograms are compared to the frequencies of the reference distances
+def check_calc_diff(n=6, num_schedules=300, seed=0):
+    os.makedirs("Distances")
+    make_sample_file(n, num_schedules, "sample.csv", seed)
+    open("empty.csv", "w").close()
+    found = []
+
+    for name in ["sample.csv", "empty.csv"]:
+        time_quiet(calc.calc_diff_python, name, n)
+        expected = read_distances(name)
+        expected_histograms = np.array([np.bincount(np.array(text.split(",")[:-1], dtype=np.int64), minlength=calc.histogram_size(n)) for text in expected])
+
+        for label, function, kwargs in [("calc_diff", calc.calc_diff, {}), ("parallel", calc.calc_diff_parallel, {"processes": 2, "memory": 1 << 16})]:
+            time_quiet(function, name, n, **kwargs)
+            same = read_distances(name) == expected
+
+            time_quiet(function, name, n, histogram=True, **kwargs)
+            _, histograms = calc.load_histograms(calc.histogram_path(name))
+            same_histograms = np.array_equal(histograms.T, expected_histograms)
+
+            found.append((name, label, same, same_histograms))
+
+    return all(same and same_histograms for _, _, same, same_histograms in found), f"(file, function, same distances, same histograms): {found}"
+
+
+# Runs a worker which is killed while it searches its first task, so the coordinator has to hand the task out again
+def run_killed_worker(address, authkey):
+    conn = Client(address, authkey=authkey.encode())
+    conn.recv()
+    os._exit(1)
+
+
+# Starts the killed worker, and a worker which searches all tasks once the killed worker is gone
+def start_check_workers(address, authkey):
+    context = multiprocessing.get_context("spawn")
+    killed = context.Process(target=run_killed_worker, args=(address, authkey))
+    killed.start()
+    killed.join()
+
+    worker = context.Process(target=run_worker, args=(address, authkey))
+    worker.start()
+    return worker
+
+
+# Checks that a distributed run on localhost saves the same schedules and count as a serial run, in csv and bin
+# A client drops during the handshake and one of the two workers is killed with a task, before the other worker starts
+# The other worker stays connected for both runs, as it would for consecutive n
+def check_distributed(n=4, seed=0):
+    os.makedirs("Count")
+    authkey = secrets.token_hex(16)
+    found = []
+
+    coordinator = Coordinator(("localhost", 0), authkey, timeout=10)
+    address = coordinator.listener.address
+    workers = []
+    starter = threading.Thread(target=lambda: workers.append(start_check_workers(address, authkey)))
+    try:
+        socket.create_connection(address).close()
+        starter.start()
+
+        for format in ["csv", "bin"]:
+            args = make_args(normalize=True, count=0, save="serial", format=format)
+            np.random.seed(seed)
+            time_quiet(generate_TTP, n, args)
+            serial = read_run(n, args)
+
+            args = make_args(normalize=True, count=0, save="distributed", format=format)
+            np.random.seed(seed)
+            time_quiet(generate_TTP_distributed, n, args, coordinator)
+            distributed = read_run(n, args)
+
+            found.append((format, serial[1], distributed[1], serial[0] == distributed[0]))
+    finally:
+        coordinator.close()
+        starter.join()
+        for worker in workers:
+            worker.join()
+
+    return all(s == d and same for _, s, d, same in found), f"(format, serial count, distributed count, same schedules): {found}"
+
+
+# Correctness checks which can be run with --check, each returns whether it passed and what was found
+CHECKS = [("append_bin", check_append_bin), ("line_index", check_line_index), ("engine_order", check_engine_order),
+          ("prune_order", check_prune_order), ("resume", check_resume), ("count_engines", check_count_engines),
+          ("calc_diff", check_calc_diff), ("distributed", check_distributed)]
+
+
+# Runs all checks in a temporary folder and prints their results, returns whether all checks passed
+def run_checks():
+    passed = True
+
+    for name, check in CHECKS:
+        ok, found = in_temp_folder(check)
+        print(f"{name:>13} {'ok' if ok else 'FAILED':>6}  {found}")
+        passed = passed and ok
+
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the TTP search engines")
+    parser.add_argument("engines", type=str, nargs="*", default=list(ENGINES), help="Engines to compare, the first one is the baseline")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the order of the matchups")
+    parser.add_argument("--save", action="store_true", help="Benchmark saving the schedules instead of the engines")
+    parser.add_argument("--check", action="store_true", help="Run the correctness checks instead of the benchmarks")
+    parser.add_argument("--suite", action="store_true", help="Run the benchmark suite of the search, sampling, verifier, distances and fit")
+    parser.add_argument("--output", type=str, help="File to save the results of the suite to, as JSON. Defaults to Benchmarks/bench-<date>.json")
+    parser.add_argument("--compare", type=str, help="Results file of an earlier suite run to compare the results to")
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if run_checks() else 1)
+    elif args.suite:
+        results = bench_suite(seed=args.seed)
+        output = args.output if args.output != None else f"Benchmarks/bench-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+        save_suite(results, output, args.seed)
+        print(f"Results saved to {output}")
+        if args.compare != None:
+            compare_suite(results, args.compare)
+    elif args.save:
+        bench_save(seed=args.seed)
+    else:
+        bench_engines(args.engines, seed=args.seed)
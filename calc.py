@@ -1,9 +1,13 @@
 import math
+import argparse
 import ast
-import sys
+import os
+import collections
 import numpy as np
+from multiprocessing import Pool, shared_memory
 from TTP import *
 from scipy.stats import beta, betabinom
+from scipy.optimize import minimize
 from sklearn.metrics import r2_score
 
 
@@ -31,36 +35,113 @@ def diff_beta_binom_fit(x, expected, max_diff, a, b):
     score = np.sum((expected - pdf)**2)
     return score
 
+# Grid of alpha and beta values on which the beta-binomial fit starts, log spaced as the fit is relative
+FIT_GRID = np.logspace(-2, 3, 101)
+
+# Bounds of alpha and beta in the fit
+FIT_BOUNDS = (1e-3, 1e4)
+
+
+# Fits a beta-binomial distribution to the frequencies data of the values x, by least squares on the pmf
+# The pmf is evaluated for the whole grid of (alpha, beta) at once with broadcasting, and the best point
+# of the grid is refined with a bounded optimizer on log(alpha) and log(beta)
 def fit_beta_binom(x, data, max_diff):
-    x = list(x)
-    best_fit = np.inf
-    best_pmf = None
+    x = np.asarray(x)
     expected = data / np.sum(data)
 
-    print(x)
+    pmf = betabinom.pmf(x, max_diff, FIT_GRID[:, None, None], FIT_GRID[None, :, None], loc=0)
+    scores = np.sum((expected - pmf)**2, axis=2)
+    a, b = np.unravel_index(np.nanargmin(scores), scores.shape)
+
+    result = minimize(lambda p: diff_beta_binom_fit(x, expected, max_diff, *np.exp(p)),
+                      np.log([FIT_GRID[a], FIT_GRID[b]]), method="L-BFGS-B", bounds=[np.log(FIT_BOUNDS)] * 2)
+
+    alpha, beta = np.exp(result.x)
+    return float(alpha), float(beta)
+
+
+# Returns the number of teams for a given number of matchups in a schedule, n*(n-1) = num_matchups
+def teams_from_matchups(num_matchups):
+    return int(round((1 + math.sqrt(1 + 4 * num_matchups)) / 2))
+
+
+# Reads the header of a binary schedule file and returns the number of teams
+def read_binary_header(path):
+    with open(path, "rb") as file:
+        header = file.read(BINARY_HEADER_SIZE)
+
+    if len(header) != BINARY_HEADER_SIZE or header[:4] != BINARY_MAGIC:
+        raise ValueError(f"{path} is not a binary schedule file")
+    if header[4] != BINARY_VERSION:
+        raise ValueError(f"{path} has binary format version {header[4]}, expected {BINARY_VERSION}")
+
+    return header[5]
+
+
+# Loads a binary schedule file as a read-only memory map of shape (schedules, n*(n-1), 2)
+# The last axis holds the home and away team of each matchup, nothing is copied into memory
+def load_schedules_bin(path):
+    n = read_binary_header(path)
+    num_matchups = calc_matchups(n)
+    num_schedules = (os.path.getsize(path) - BINARY_HEADER_SIZE) // (num_matchups * 2)
+
+    if num_schedules == 0:
+        return np.zeros((0, num_matchups, 2), dtype=np.uint8)
+
+    return np.memmap(path, dtype=np.uint8, mode="r", offset=BINARY_HEADER_SIZE, shape=(num_schedules, num_matchups, 2))
+
+
+# Parses lines of a schedule file into an array of shape (schedules, n*(n-1), 2)
+def parse_schedule_lines(lines, n):
+    values = " ".join(lines).replace(",", " ").split()
+    return np.array(values, dtype=np.uint8).reshape(-1, calc_matchups(n), 2)
+
+
+# Loads a text schedule file into an array of shape (schedules, n*(n-1), 2)
+def load_schedules_csv(path, n):
+    with open(path, "r") as file:
+        return parse_schedule_lines([line for line in file if len(line) > 1], n)
+
+
+# Loads a schedule file in either format, binary files are memory mapped
+def load_schedules(path, n=None):
+    if path.endswith(".bin"):
+        return load_schedules_bin(path)
+    return load_schedules_csv(path, n)
+
+
+# Converts a schedule file between the text and binary formats, the format is given by the file extensions
+# The schedules are converted in chunks, so files larger than memory can be converted
+def convert_schedules(src, dest, n=None, chunk_size=100000):
+    if src.endswith(".bin"):
+        schedules = load_schedules_bin(src)
 
-    p = 3
+        with open(dest, "w") as file:
+            for start in range(0, len(schedules), chunk_size):
+                for schedule in schedules[start:start + chunk_size].tolist():
+                    file.write(" ".join([str(m[0]) + "," + str(m[1]) for m in schedule]) + "\n")
+        return
 
-    # For loop to roughly find the best fit
-    for a in np.arange(0, 10**p, 10**(p-2)):
-        for b in np.arange(0, 10**p, 10**(p-2)):
-            result = diff_beta_binom_fit(x, expected, max_diff, a, b)
-            if result < best_fit:
-                best_fit = result
-                best_pmf = (a, b)
-    
-    # Refine the best fit with smaller step sizes
-    for step in [10**s for s in range(-2, p)]:
-        currentA, currentB = best_pmf
-        adj = step * 10
-        for a in np.arange(currentA - adj, currentA + adj, step):
-            for b in np.arange(currentB - adj, currentB + adj, step):
-                result = diff_beta_binom_fit(x, expected, max_diff, a, b)
-                if result < best_fit:
-                    best_fit = result
-                    best_pmf = (a, b)
+    with open(src, "r") as file:
+        with open(dest, "wb") as dest_file:
+            lines = []
+            for line in file:
+                if len(line) < 2:
+                    continue
+
+                # The number of teams follows from the number of matchups in a schedule
+                if n == None:
+                    n = teams_from_matchups(len(line.split()))
+                if dest_file.tell() == 0:
+                    dest_file.write(binary_header(n))
+
+                lines.append(line)
+                if len(lines) == chunk_size:
+                    dest_file.write(parse_schedule_lines(lines, n).tobytes())
+                    lines = []
 
-    return best_pmf
+            if lines:
+                dest_file.write(parse_schedule_lines(lines, n).tobytes())
 
 
 # Verifies one given schedule
@@ -104,43 +185,426 @@ def verify(n, schedule, matchups, count):
 
 
 # Verifies all schedules in a file
+# The matchups are taken from the table cache once, each schedule gets a copy of them as a set,
+# so verify looks up and removes its matchups in constant time
 def verify_schedules(n, path):
+    all_matchups = frozenset(get_matchups(n))
+
     with open(path, "r") as file:
         count = 1
         for line in file:
-            matchups = []
-            generate_matchups(n, matchups)
             schedule = ast.literal_eval("[" + line + "]")
-            verify(n, schedule, matchups, count)
+            verify(n, schedule, set(all_matchups), count)
             count += 1
 
 
-# Samples from all solutions to get a uniform distribution
-def sample_schedules(n, path, sample_size):
+# Fields of the report of verify_batch, the number of violations of each constraint per schedule
+VERIFY_FIELDS = ["invalid_matchups", "repeated_matchups", "round_conflicts", "back_to_back", "home_streaks", "away_streaks"]
+
+
+# Counts the runs of more than three home games (or away games) in a row, per schedule and team
+# A run is counted once at its fourth game, like verify reports a streak violation once per run
+def count_long_streaks(games):
+    four = games[:, :-3] & games[:, 1:-2] & games[:, 2:-1] & games[:, 3:]
+    starts = four.copy()
+    starts[:, 1:] &= ~games[:, :-4]
+    return starts.sum(axis=(1, 2))
+
+
+# Verifies a batch of schedules of shape (S, n*(n-1), 2) at once with numpy
+# Returns a structured array with for each schedule its index, the number of violations of each
+# constraint and whether it is valid:
+# - invalid_matchups: matchups of a team against itself or with a team index >= n
+# - repeated_matchups: matchups played more than once, so others are missing
+# - round_conflicts: teams playing more than once in a round
+# - back_to_back: matchups of which the reverse is played in the next round
+# - home_streaks/away_streaks: runs of more than three home/away games in a row of a team
+# The back-to-back and streak checks look at one game per team per round, rounds with conflicts are only counted as such
+def verify_batch(n, schedules, start=0):
+    schedules = np.asarray(schedules).astype(np.intp)
+    num_schedules = len(schedules)
+    num_rounds = 2 * (n - 1)
+    report = np.zeros(num_schedules, dtype=[("index", np.int64)] + [(field, np.int32) for field in VERIFY_FIELDS] + [("valid", bool)])
+    report["index"] = np.arange(start, start + num_schedules)
+
+    home_team = schedules[..., 0]
+    away_team = schedules[..., 1]
+    report["invalid_matchups"] = ((home_team == away_team) | (home_team >= n) | (away_team >= n)).sum(axis=1)
+
+    # Every valid matchup gets an id, a repeated id shows up as two equal neighbours after sorting
+    ids = np.sort(np.minimum(home_team, n) * (n + 1) + np.minimum(away_team, n), axis=1)
+    report["repeated_matchups"] = (ids[:, 1:] == ids[:, :-1]).sum(axis=1)
+
+    # Each team plays once per round if the sorted teams of a round are 0 to n-1
+    teams = np.sort(schedules.reshape(num_schedules, num_rounds, n), axis=2)
+    report["round_conflicts"] = (teams != np.arange(n)).any(axis=2).sum(axis=1)
+
+    # Opponent and home/away assignment of each team in each round
+    rounds = np.minimum(schedules, n - 1).reshape(num_schedules, num_rounds, n//2, 2)
+    opponents = np.zeros((num_schedules, num_rounds, n), dtype=np.intp)
+    home = np.zeros((num_schedules, num_rounds, n), dtype=bool)
+    s_index = np.arange(num_schedules)[:, None, None]
+    r_index = np.arange(num_rounds)[None, :, None]
+    opponents[s_index, r_index, rounds[..., 1]] = rounds[..., 0]
+    opponents[s_index, r_index, rounds[..., 0]] = rounds[..., 1]
+    home[s_index, r_index, rounds[..., 0]] = True
+
+    # A reversed matchup in the next round has the same opponents with swapped home/away, for both teams
+    reversed = (opponents[:, 1:] == opponents[:, :-1]) & (home[:, 1:] != home[:, :-1])
+    report["back_to_back"] = reversed.sum(axis=(1, 2)) // 2
+
+    report["home_streaks"] = count_long_streaks(home)
+    report["away_streaks"] = count_long_streaks(~home)
+
+    report["valid"] = np.all([report[field] == 0 for field in VERIFY_FIELDS], axis=0)
+    return report
+
+
+# Verifies all schedules in a file in batches of chunk_size schedules, binary files are memory mapped
+# Prints a summary of the violations and returns the report of verify_batch for all schedules
+def verify_schedules_batch(n, path, chunk_size=1 << 16):
+    schedules = load_schedules(path, n)
+    reports = [verify_batch(n, schedules[start:start + chunk_size], start) for start in range(0, len(schedules), chunk_size)]
+    report = np.concatenate(reports) if reports else verify_batch(n, np.zeros((0, calc_matchups(n), 2), dtype=np.uint8))
+
+    print(f"Verified {len(report)} schedules, {np.sum(~report['valid'])} invalid")
+    for field in VERIFY_FIELDS:
+        if report[field].any():
+            print(f"\t{field}: {np.count_nonzero(report[field])} schedules, {report[field].sum()} violations")
+
+    return report
+
+
+# Draws a uniform sample of sample_size lines from an iterable of lines in one pass, with reservoir sampling
+# Uses the skip-based Algorithm L, so after the reservoir is filled only O(k log(N/k)) random numbers are drawn
+# Returns the sampled (line number, line) pairs in file order
+def reservoir_sample(lines, sample_size, rng):
+    reservoir = []
+    if sample_size <= 0:
+        return reservoir
+
+    w = np.exp(np.log(rng.random()) / sample_size)
+    next_index = sample_size + int(np.floor(np.log(rng.random()) / np.log1p(-w)))
+
+    for i, line in enumerate(lines):
+        if i < sample_size:
+            reservoir.append((i, line))
+        elif i == next_index:
+            # Replace a random line in the reservoir and skip ahead to the next line to keep
+            reservoir[rng.integers(sample_size)] = (i, line)
+            w *= np.exp(np.log(rng.random()) / sample_size)
+            next_index += int(np.floor(np.log(rng.random()) / np.log1p(-w))) + 1
+
+    return sorted(reservoir)
+
+
+# Builds an index with the byte offset of every schedule line in a text schedule file
+# The index is saved next to the file as path + ".idx.npy", so it only has to be built once
+# The size and modification time of the file are saved in front of the offsets, so a changed file is indexed again
+def build_line_index(path):
+    stat = os.stat(path)
+    offsets = []
+    with open(path, "rb") as file:
+        offset = 0
+        for line in file:
+            if len(line.strip()) > 0:
+                offsets.append(offset)
+            offset += len(line)
+
+    index = np.array(offsets, dtype=np.int64)
+    np.save(path + ".idx.npy", np.concatenate(([stat.st_size, stat.st_mtime_ns], index)).astype(np.int64))
+    return index
+
+
+# Returns the line index of a text schedule file, from path + ".idx.npy" if it was built for the file as it is now
+# The index is built again if it is missing, or the size or modification time of the file changed since it was built
+def load_line_index(path):
+    if os.path.exists(path + ".idx.npy"):
+        stat = os.stat(path)
+        saved = np.load(path + ".idx.npy")
+        if len(saved) >= 2 and saved[0] == stat.st_size and saved[1] == stat.st_mtime_ns:
+            return saved[2:]
+
+    return build_line_index(path)
+
+
+# Samples from all solutions to get a uniform distribution, with a reproducible seed
+# Without an index the file is read once with reservoir sampling. With use_index, the byte offsets of the lines are
+# loaded from the line index (built if missing or out of date) and only the sampled lines are read. Binary schedule files have
+# fixed-width rows, so they are always sampled without reading the rest of the file.
+# The sampled schedules are written to dest in file order, by default a file in the format of the schedule file
+def sample_schedules(n, path, sample_size, dest=None, seed=None, use_index=False):
+    rng = np.random.default_rng(seed)
+    format = "bin" if path.endswith(".bin") else "csv"
+    dest = dest if dest != None else f'Schedules/Uniform/Uniform-{n}.{format}'
+
+    if path.endswith(".bin"):
+        schedules = load_schedules_bin(path)
+        rows = np.sort(rng.choice(len(schedules), min(sample_size, len(schedules)), replace=False))
+        with open(dest, "wb") as file:
+            file.write(binary_header(n))
+            file.write(np.ascontiguousarray(schedules[rows]).tobytes())
+        return
+
+    if use_index:
+        index = load_line_index(path)
+        offsets = np.sort(rng.choice(index, min(sample_size, len(index)), replace=False))
+
+        with open(path, "rb") as file, open(dest, "wb") as dest_file:
+            for offset in offsets:
+                file.seek(offset)
+                dest_file.write(file.readline())
+        return
+
     with open(path, "r") as file:
-        count = 0
-        schedules = []
+        sample = reservoir_sample((line for line in file if len(line.strip()) > 0), sample_size, rng)
 
-        for line in file:
-            if line == "\n":
-                continue
-            count += 1
+    with open(dest, "w") as dest_file:
+        for _, line in sample:
+            dest_file.write(line)
 
-        # Generate uniform unique indexes to sample from
-        indexes = np.random.choice(count, sample_size, replace=False)
-        count = 0
 
-    with open(path, "r") as file:
-        with open(f'Schedules/Uniform/Uniform-{n}.csv', 'w') as dest:
-            for line in file:
-                if count in indexes:
-                    dest.write(line)
-                    indexes = np.delete(indexes, np.where(indexes == count))
-                count += 1
+# Encodes schedules of shape (S, n*(n-1), 2) per round and team, for the vectorized distances
+# opponents[s, r*n + t] is the opponent of team t in round r of schedule s, home[s, r*n + t] whether t plays at home
+def encode_schedules(schedules, n):
+    num_schedules = len(schedules)
+    rounds = np.asarray(schedules).reshape(num_schedules, 2 * (n-1), n//2, 2).astype(np.intp)
+    num_rounds = rounds.shape[1]
+
+    opponents = np.zeros((num_schedules, num_rounds, n), dtype=np.uint8)
+    home = np.zeros((num_schedules, num_rounds, n), dtype=bool)
+    s_index = np.arange(num_schedules)[:, None, None]
+    r_index = np.arange(num_rounds)[None, :, None]
+
+    opponents[s_index, r_index, rounds[..., 0]] = rounds[..., 1]
+    opponents[s_index, r_index, rounds[..., 1]] = rounds[..., 0]
+    home[s_index, r_index, rounds[..., 0]] = True
+
+    return opponents.reshape(num_schedules, num_rounds * n), home.reshape(num_schedules, num_rounds * n)
+
+
+# Calculates the distances between every schedule in block a and every schedule in block b, each of shape (len(a), len(b))
+# A matchup of a is in the same round of b if its home team has the same opponent and plays at home in both,
+# which holds for both teams of the matchup, so the number of shared matchups is half the number of equal teams.
+# Likewise for the reduced distance, where only the opponents have to be equal.
+# The home/away distance is the number of teams with a different home/away assignment in a round
+def block_distances(opponents_a, home_a, opponents_b, home_b, num_matchups):
+    same_opponent = opponents_a[:, None, :] == opponents_b[None, :, :]
+    same_home = home_a[:, None, :] == home_b[None, :, :]
+
+    diff = num_matchups - (same_opponent & same_home).sum(axis=2) // 2
+    reduced_diff = num_matchups - same_opponent.sum(axis=2) // 2
+    HA_diff = (~same_home).sum(axis=2)
+
+    return diff, reduced_diff, HA_diff
+
+
+# Counts how often each value of the three distances occurs between rows [start, stop) and all later schedules
+# Each tile of block_size columns is counted as soon as it is calculated, so only one tile of rows * block_size
+# distances is kept in memory, whatever the number of schedules
+def strip_histograms(opponents, home, start, stop, block_size, num_matchups, size):
+    histograms = np.zeros((3, size), dtype=np.int64)
+    rows = np.arange(start, stop)
+
+    for col in range(start + 1, len(opponents), block_size):
+        distances = block_distances(opponents[start:stop], home[start:stop], opponents[col:col + block_size], home[col:col + block_size], num_matchups)
+        later = np.arange(col, min(col + block_size, len(opponents)))[None, :] > rows[:, None]
+        for histogram, distance in zip(histograms, distances):
+            histogram += np.bincount(distance[later], minlength=size)
+
+    return histograms
+
+
+# Formats the distances of each row as comma terminated values, the format of the Distances files
+def format_distances(distances):
+    return "".join([",".join(map(str, row)) + "," for row in distances if len(row) > 0])
+
+
+# Calculates the three distances of rows [start, stop) to all later schedules, in chunks of block_size columns
+# Row s only keeps the distances to the schedules after it, so each result is a list of rows of decreasing length
+def strip_distances(opponents, home, start, stop, block_size, num_matchups):
+    blocks = [[], [], []]
+
+    for col in range(start + 1, len(opponents), block_size):
+        distances = block_distances(opponents[start:stop], home[start:stop], opponents[col:col + block_size], home[col:col + block_size], num_matchups)
+        for block, distance in zip(blocks, distances):
+            block.append(distance)
+
+    if not blocks[0]:
+        return [[], [], []]
+
+    strips = []
+    for block in blocks:
+        rows = np.concatenate(block, axis=1)
+        strips.append([rows[k, k:] for k in range(stop - start)])
+    return strips
+
+
+# Returns the paths of the three Distances files of a schedule file
+def distance_paths(filepath):
+    name = filepath.split("\\")[-1].split(".")[0]
+    return [f"Distances/Distances {name}.csv", f"Distances/Distances Reduced {name}.csv", f"Distances/Distances Teamless {name}.csv"]
+
+
+# Returns the path of the histogram file of a schedule file
+def histogram_path(filepath):
+    name = filepath.split("\\")[-1].split(".")[0]
+    return f"Distances/Histogram {name}.csv"
+
+
+# Returns the number of values a distance can take for n teams
+# The home/away distance is the largest, with at most n different assignments in each of the 2*(n-1) rounds
+def histogram_size(n):
+    return 2 * n * (n - 1) + 1
+
+
+# Saves the histograms of the three distances, with one row per distance value:
+# distance, frequency of diff, frequency of reduced_diff, frequency of HA_diff
+def save_histograms(filepath, histograms):
+    rows = np.column_stack([np.arange(histograms.shape[1]), histograms.T])
+    np.savetxt(histogram_path(filepath), rows, fmt="%d", delimiter=",", header="distance,diff,reduced_diff,HA_diff", comments="")
+
+
+# Loads a histogram file, returns the distance values and the frequencies of the three distances, shape (values, 3)
+def load_histograms(path):
+    rows = np.loadtxt(path, dtype=np.int64, delimiter=",", skiprows=1, ndmin=2)
+    return rows[:, 0], rows[:, 1:]
+
+
+# Adds the distances of one strip to the histograms, or writes them to the Distances files
+# A strip is either a list of the three formatted distances, or of the three histograms
+def handle_strip(strip, dests, histograms):
+    if histograms is not None:
+        for histogram, counts in zip(histograms, strip):
+            histogram += counts
+    else:
+        for dest, text in zip(dests, strip):
+            dest.write(text)
+
+
+# Calculate the distance between all schedules in a file, using numpy on blocks of schedules
+# The distances are written in the same order and format as calc_diff_python, schedule pairs (s, c) with s < c
+# Each block of rows is compared to all later schedules in chunks of block_size columns
+# With histogram, only the frequency of each distance is kept and saved to one histogram file,
+# which takes O(max distance) memory and disk instead of O(S^2)
+def calc_diff(filepath, n, block_size=256, histogram=False):
+    opponents, home = encode_schedules(load_schedules(filepath, n), n)
+    num_matchups = calc_matchups(n)
+    size = histogram_size(n)
+    histograms = np.zeros((3, size), dtype=np.int64) if histogram else None
+    dests = [open(path, "w") for path in distance_paths(filepath)] if not histogram else []
+
+    for start in range(0, len(opponents), block_size):
+        stop = min(start + block_size, len(opponents))
+        if histogram:
+            handle_strip(strip_histograms(opponents, home, start, stop, block_size, num_matchups, size), dests, histograms)
+        else:
+            handle_strip([format_distances(strip) for strip in strip_distances(opponents, home, start, stop, block_size, num_matchups)], dests, histograms)
+
+    for dest in dests:
+        dest.close()
+    if histogram:
+        save_histograms(filepath, histograms)
+
+    print("Distances calculated")
+
+
+# Approximate number of bytes used per schedule pair of a strip: the three distances as text and as arrays
+STRIP_BYTES_PER_PAIR = 32
+
+# Default memory budget of calc_diff_parallel in bytes
+DIFF_MEMORY = 1 << 28
+
+# The encoded schedules shared with the worker processes of calc_diff_parallel
+SHARED_SCHEDULES = {}
+
+
+# Attaches a worker process to the encoded schedules in shared memory
+def attach_shared_schedules(names, shape):
+    for key, name, dtype in zip(["opponents", "home"], names, [np.uint8, bool]):
+        shm = shared_memory.SharedMemory(name=name)
+        SHARED_SCHEDULES[key + "_shm"] = shm
+        SHARED_SCHEDULES[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+# Calculates the distances of one strip of rows in a worker process
+# Returns them formatted, or as histograms of the given size
+def run_strip(task):
+    start, stop, block_size, num_matchups, size = task
+
+    if size != None:
+        return strip_histograms(SHARED_SCHEDULES["opponents"], SHARED_SCHEDULES["home"], start, stop, block_size, num_matchups, size)
+
+    strips = strip_distances(SHARED_SCHEDULES["opponents"], SHARED_SCHEDULES["home"], start, stop, block_size, num_matchups)
+    return [format_distances(strip) for strip in strips]
+
+
+# Copies an array to a new block of shared memory
+def to_shared_memory(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm
+
+
+# Calculate the distance between all schedules in a file on a pool of worker processes
+# The pair matrix is split in strips of rows, each strip is compared to all later schedules in tiles.
+# The encoded schedules are in shared memory, and strips are written in order as they finish,
+# with at most two strips per process in flight, so the output is the same as calc_diff.
+# The strips and tiles are sized so all strips in flight together use about memory bytes.
+# With histogram, a strip only keeps one tile of distances, so the memory is bounded for any number of schedules.
+# Without histogram, a strip keeps the distances of its rows to all later schedules, so it takes at least
+# one row of O(S) distances, and more than memory bytes when memory is smaller than S * STRIP_BYTES_PER_PAIR per strip
+def calc_diff_parallel(filepath, n, processes=None, memory=DIFF_MEMORY, histogram=False):
+    opponents, home = encode_schedules(load_schedules(filepath, n), n)
+    num_schedules, width = opponents.shape
+    num_matchups = calc_matchups(n)
+    processes = processes if processes != None else os.cpu_count()
+    in_flight = 2 * processes
+    size = histogram_size(n) if histogram else None
+
+    # Rows per strip and columns per tile, both at least one
+    # A histogram strip only holds one tile, which is made about square, otherwise the rows hold all their distances
+    strip_memory = memory // in_flight
+    if histogram:
+        rows = max(1, min(num_schedules, math.isqrt(strip_memory // (width * 3))))
+    else:
+        rows = max(1, strip_memory // max(1, num_schedules * STRIP_BYTES_PER_PAIR))
+    block_size = max(1, strip_memory // (rows * width * 3))
+    tasks = [(start, min(start + rows, num_schedules), block_size, num_matchups, size) for start in range(0, num_schedules, rows)]
+
+    histograms = np.zeros((3, histogram_size(n)), dtype=np.int64) if histogram else None
+    dests = [open(path, "w") for path in distance_paths(filepath)] if not histogram else []
+    shms = [to_shared_memory(opponents), to_shared_memory(home)]
+
+    try:
+        with Pool(processes, initializer=attach_shared_schedules, initargs=([shm.name for shm in shms], opponents.shape)) as pool:
+            pending = collections.deque()
+
+            for task in tasks:
+                pending.append(pool.apply_async(run_strip, (task,)))
+
+                # Handle the oldest strip once the maximum number of strips is in flight
+                if len(pending) >= in_flight:
+                    handle_strip(pending.popleft().get(), dests, histograms)
+
+            while pending:
+                handle_strip(pending.popleft().get(), dests, histograms)
+    finally:
+        for dest in dests:
+            dest.close()
+        for shm in shms:
+            shm.close()
+            shm.unlink()
+
+    if histogram:
+        save_histograms(filepath, histograms)
 
+    print("Distances calculated")
 
-# Calculate the distance between all schedules in a file
-def calc_diff(filepath, n):
+
+# Calculate the distance between all schedules in a file, comparing the schedules matchup by matchup
+# This is the reference implementation of calc_diff
+def calc_diff_python(filepath, n):
     with open(filepath, "r") as file:
         schedules = []
         name = filepath.split("\\")[-1].split(".")[0]
@@ -218,8 +682,17 @@ def calc_uniformity(filepath, limit=0):
 
 
 if __name__ == "__main__":
-    filepath = sys.argv[1]
-    n = int(sys.argv[2])
-    calc_diff(filepath, n)
+    parser = argparse.ArgumentParser(description="Calculate the distances between all schedules in a file")
+    parser.add_argument("filepath", type=str, help="Schedule file, csv or bin")
+    parser.add_argument("n", type=int, help="Number of teams")
+    parser.add_argument("processes", type=int, nargs="?", help="Number of worker processes, the distances are calculated in one process if not given")
+    parser.add_argument("--histogram", action="store_true", help="Only save the frequencies of the distances")
+    parser.add_argument("--memory", type=int, default=DIFF_MEMORY, help="Memory budget in bytes of the strips in flight. Only used with processes")
+    args = parser.parse_args()
+
+    if args.processes != None:
+        calc_diff_parallel(args.filepath, args.n, processes=args.processes, memory=args.memory, histogram=args.histogram)
+    else:
+        calc_diff(args.filepath, args.n, histogram=args.histogram)
     # calc_uniformity(filepath)
-    # sample_schedules(n, filepath, 10000)
\ No newline at end of file
+    # sample_schedules(n, filepath, 10000, seed=0)
\ No newline at end of file
@@ -1,6 +1,19 @@
 import os
+import json
+import timeit
 
 COUNT = 0
+WRITER = None
+
+# Size in characters and time in seconds after which the schedule writer flushes its buffer
+BUFFER_SIZE = 1 << 22
+FLUSH_INTERVAL = 10
+
+# Header of the binary schedule format: magic, format version, number of teams and matchups per round
+# Every schedule after the header is a row of n*(n-1) (home, away) pairs of uint8 team indices
+BINARY_MAGIC = b"TTPS"
+BINARY_VERSION = 1
+BINARY_HEADER_SIZE = 8
 
 # Counts the number of times a schedule is completed
 def counter(print=False):
@@ -10,6 +23,12 @@ def counter(print=False):
         print(COUNT)
 
 
+# Adds a number of completed schedules to the counter
+def add_count(count):
+    global COUNT
+    COUNT += count
+
+
 # Returns value of the counter
 def get_count():
     return COUNT
@@ -69,30 +88,179 @@ def save_count(n, args, prefix=""):
 
 
 # Generate the path names for the schedules if save is provided
+# Tasks of a parallel run (args.part is set) write to their own part file in the same folder
+# Schedules saved in the binary format get the .bin extension
 def generate_paths(n, args):
-    file_name = args.save + "-" + str(n) + ".csv"
+    file_name = args.save + "-" + str(n) + "." + args.format
     folder_path = "Schedules/Schedules_" + args.save
     file_path = folder_path + "/" + file_name
+    if getattr(args, "part", None) != None:
+        file_path += ".part" + str(args.part)
     return file_name, folder_path, file_path
 
 
+# Creates the folder of the schedule file if it doesn't exist, so schedules can also be appended to a new file
+def init_folder(n, args):
+    _, folder, _ = generate_paths(n, args)
+
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+
 # Initiates saving the schedule to a file if save is provided
 def init_save(n, args):
-    _, folder, path = generate_paths(n, args)
+    _, _, path = generate_paths(n, args)
 
     # Create the folder if it doesn't exist
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+    init_folder(n, args)
     
-    # Clear the file if it already exists
-    with open(path, "w") as file:
-        file.write("")
+    # Clear the file if it already exists, binary files start with their header
+    with open(path, "wb") as file:
+        if args.format == "bin":
+            file.write(binary_header(n))
+
+
+# Returns the header of a binary schedule file for n teams
+def binary_header(n):
+    return BINARY_MAGIC + bytes([BINARY_VERSION, n, n//2, 0])
+
+
+# Returns the encoded matchups, the separator between matchups and the end of a schedule in the given format
+# In the csv format every schedule is a line of "home,away" matchups, in the bin format a row of uint8 pairs
+def schedule_encoding(n, format="csv"):
+    if format == "bin":
+        labels = {(i, j): bytes([i, j]) for i in range(n) for j in range(n) if i != j}
+        return labels, b"", b""
+
+    labels = {(i, j): (str(i) + "," + str(j)).encode() for i in range(n) for j in range(n) if i != j}
+    return labels, b" ", os.linesep.encode()
+
+
+# Writes schedules to one open file, formatted lines are buffered and written in large blocks
+# The buffer is flushed when it holds buffer_size bytes, or flush_interval seconds after the last flush
+class ScheduleWriter:
+    def __init__(self, path, n, mode="a", buffer_size=BUFFER_SIZE, flush_interval=FLUSH_INTERVAL, format="csv"):
+        self.file = open(path, mode + "b")
+        self.lines = []
+        self.size = 0
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.last_flush = timeit.default_timer()
+        self.labels, self.separator, self.end = schedule_encoding(n, format)
+
+        # Appending to a new binary file, so it still needs its header
+        if format == "bin" and mode == "a" and self.file.tell() == 0:
+            self.file.write(binary_header(n))
+
+    # Adds one schedule to the buffer, in the format of the schedule file
+    def write(self, schedule):
+        line = self.separator.join([self.labels[m] for m in schedule]) + self.end
+        self.lines.append(line)
+        self.size += len(line)
+
+        if self.size >= self.buffer_size or timeit.default_timer() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    # Writes the buffer to the file
+    def flush(self):
+        self.file.write(b"".join(self.lines))
+        self.file.flush()
+        self.lines = []
+        self.size = 0
+        self.last_flush = timeit.default_timer()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+# Opens the schedule writer for the schedule file, returns False if a writer was already open
+def open_writer(n, args, mode="a"):
+    global WRITER
+    if WRITER != None:
+        return False
+
+    _, _, path = generate_paths(n, args)
+    init_folder(n, args)
+    WRITER = ScheduleWriter(path, n, mode, format=args.format)
+    return True
+
+
+# Sets the schedule writer used by handle_save, e.g. a writer which sends the schedules elsewhere than a file
+def set_writer(writer):
+    global WRITER
+    WRITER = writer
+
+
+# Flushes and closes the schedule writer
+def close_writer():
+    global WRITER
+    if WRITER != None:
+        WRITER.close()
+        WRITER = None
 
 
 # Function which appends the current schedule to the file
 def handle_save(n, schedule, args):
+    # Without an open writer, the schedule is appended to the file directly
+    if WRITER == None:
+        open_writer(n, args)
+        WRITER.write(schedule)
+        close_writer()
+        return
+
+    WRITER.write(schedule)
+
+
+# Generate the path of the checkpoint file for n teams
+def checkpoint_path(n, prefix=""):
+    return prefix + "Checkpoint/Checkpoint_" + str(n) + ".json"
+
+
+# Save the search frontier to the checkpoint file
+# The file is replaced in one step, so a run killed while saving still leaves the previous checkpoint
+def save_checkpoint(n, checkpoint, prefix=""):
+    path = checkpoint_path(n, prefix)
+    folder = os.path.dirname(path)
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(path + ".tmp", "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(path + ".tmp", path)
+
+
+# Load the checkpoint file, matchups and schedules are converted back to lists of tuples
+def load_checkpoint(n, prefix=""):
+    with open(checkpoint_path(n, prefix), "r") as file:
+        checkpoint = json.load(file)
+
+    checkpoint["matchups"] = [tuple(m) for m in checkpoint["matchups"]]
+    checkpoint["schedules"] = [[tuple(m) for m in schedule] for schedule in checkpoint["schedules"]]
+    return checkpoint
+
+
+# Remove the checkpoint file once a run is finished
+def remove_checkpoint(n, prefix=""):
+    if os.path.exists(checkpoint_path(n, prefix)):
+        os.remove(checkpoint_path(n, prefix))
+
+
+# Returns the size of the schedule file, which is stored in a checkpoint
+# The schedule writer is flushed first, so all schedules found so far are included
+def get_save_size(n, args):
+    if WRITER != None:
+        WRITER.flush()
+
+    _, _, path = generate_paths(n, args)
+    return os.path.getsize(path)
+
+
+# Truncates the schedule file to the size stored in a checkpoint
+# Schedules saved after the checkpoint are found again when the run is resumed
+def truncate_save(n, args, size):
     _, _, path = generate_paths(n, args)
 
-    # Append the current schedule to the file
     with open(path, "a") as file:
-        file.write(' '.join([str(matchup[0]) + ',' + str(matchup[1]) for matchup in schedule]) + "\n")
\ No newline at end of file
+        file.truncate(size)
\ No newline at end of file
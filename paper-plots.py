@@ -1,7 +1,7 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy.stats import norm, betabinom
-from calc import fit_beta_binom
+from calc import fit_beta_binom, load_histograms
 
 # Constants for font sizes
 FONTSIZE = 40
@@ -105,7 +105,8 @@ def annotate_plot(subplot, n, plot_type, max_y_axis, max_diff, mean_diff, alpha,
                     fontsize=FONTSIZE_SMALL)
 
 
-def fit_curves(x_axis, diffs, max_diff, min_diff, freqs, subplot, plot_type):
+# If counts is provided, diffs holds the distinct differences and counts how often each occurs
+def fit_curves(x_axis, diffs, max_diff, min_diff, freqs, subplot, plot_type, counts=None):
     
     # Fit and plot a beta binomial distribution to the dist of diffs
     if plot_type != DIFFERENCES_ONLY_HA:
@@ -120,7 +121,12 @@ def fit_curves(x_axis, diffs, max_diff, min_diff, freqs, subplot, plot_type):
 
         # For the teamless case, we use a normal distribution fit
         x_axis_precise = np.arange(min_diff, max_diff + 2, 0.1)
-        mu, std = norm.fit(diffs)
+        if counts is not None:
+            # Maximum likelihood fit of the normal distribution on the histogram, the same as norm.fit on all differences
+            mu = np.average(diffs, weights=counts)
+            std = np.sqrt(np.average((diffs - mu)**2, weights=counts))
+        else:
+            mu, std = norm.fit(diffs)
         mean_diff = mu
         std_diff = std
         pdf_fitted = norm.pdf(x_axis_precise, mu, std)
@@ -129,10 +135,16 @@ def fit_curves(x_axis, diffs, max_diff, min_diff, freqs, subplot, plot_type):
     return mean_diff, std_diff, alpha, beta
 
 
-def make_subplot(subplot, diffs, n, plot_type, printStats=False):
+# If counts is provided, diffs holds the distinct differences and counts how often each occurs, as in a histogram file
+def make_subplot(subplot, diffs, n, plot_type, printStats=False, counts=None):
     # Twinx axis for the subplot which is used for the beta binomial distribution fit
     subplot2 = subplot.twinx()
 
+    # Only differences which occur are kept
+    if counts is not None:
+        diffs = diffs[counts > 0]
+        counts = counts[counts > 0]
+
     # Set the min and max of the differences
     min_diff = np.min(diffs)
     max_found_diff = np.max(diffs)
@@ -143,14 +155,14 @@ def make_subplot(subplot, diffs, n, plot_type, printStats=False):
 
     # Create histogram
     x_axis = np.arange(min_diff, max_diff + 3, 2)
-    freqs, _, _ = subplot.hist(diffs, bins=x_axis, align='left', color='orange', alpha=0.9, edgecolor='black', linewidth=1)
+    freqs, _, _ = subplot.hist(diffs, bins=x_axis, weights=counts, align='left', color='orange', alpha=0.9, edgecolor='black', linewidth=1)
     max_y_axis = max(freqs) * 1.1
 
     if printStats:
         print(f"n: {n}\tMin Diff: {min_diff} \t freq: {freqs[0]}\n\tMax: {max_found_diff}\t freq: {freqs[-1]}")
 
     # Fit the curves based on the plot type
-    mean_diff, std_diff, alpha, beta = fit_curves(x_axis, diffs, max_diff, min_diff, freqs, subplot2, plot_type)
+    mean_diff, std_diff, alpha, beta = fit_curves(x_axis, diffs, max_diff, min_diff, freqs, subplot2, plot_type, counts)
 
     # Annotate plot with max, mean, and beta binomial stats
     annotate_plot(subplot, n, plot_type, max_y_axis, max_diff, mean_diff, alpha, beta)
@@ -195,6 +207,16 @@ def finish_plot(fig, file_name, show=False, twoXtwo=False):
         plt.show()
 
 
+# Loads the differences of a plot type from a Distances file, or from a histogram file made by calc_diff
+# Returns the differences and None, or the distinct differences and their counts for a histogram file
+def load_differences(file, plot_type):
+    if "Histogram" in file:
+        values, histograms = load_histograms(file)
+        return values, histograms[:, plot_type]
+
+    return np.array([int(diff) for diff in open(file, "r").read()[:-1].split(",")]), None
+
+
 def plot_diffs(files, ns, plot_type, file_name, show=False, printStats=False, twoXtwo=False):
     differences = []
 
@@ -207,10 +229,10 @@ def plot_diffs(files, ns, plot_type, file_name, show=False, printStats=False, tw
             print("Plotting differences for home/away matchups ONLY")
 
     for i, file in enumerate(files):
-        diff = np.array([int(diff) for diff in open(file, "r").read()[:-1].split(",")])
+        diff, counts = load_differences(file, plot_type)
         if plot_type != DIFFERENCES_ONLY_HA:
             diff *= 2
-        differences.append(diff)
+        differences.append((diff, counts))
 
     # Create the plot and histogram
     if twoXtwo:
@@ -219,11 +241,11 @@ def plot_diffs(files, ns, plot_type, file_name, show=False, printStats=False, tw
         fig, axes = plt.subplots(nrows=4, ncols=1, figsize=(12, 24), sharex=False)
     fig.subplots_adjust(right=0.8)
 
-    for i, diffs in enumerate(differences):
+    for i, (diffs, counts) in enumerate(differences):
         if twoXtwo:
-            make_subplot(axes[i // 2, i % 2], diffs, ns[i], plot_type, printStats)
+            make_subplot(axes[i // 2, i % 2], diffs, ns[i], plot_type, printStats, counts)
         else:
-            make_subplot(axes[i], diffs, ns[i], plot_type, printStats)
+            make_subplot(axes[i], diffs, ns[i], plot_type, printStats, counts)
 
     # Add axis labels, layout and save the figure
     finish_plot(fig, file_name, show, twoXtwo)
@@ -0,0 +1,250 @@
+from TTP import *
+from helper import *
+from TTP_stats import *
+from TTP_state import *
+from TTP_rounds import *
+from TTP_count import *
+from TTP_symmetry import *
+from TTP_iter import *
+from multiprocessing import Pool
+import argparse
+import shutil
+import os
+import heapq
+import numpy as np
+
+
+# Creates a new work item by placing matchup m in the schedule of the given work item
+# A work item is a tuple (matchups, streaks, schedule), the state of one node in the search tree
+def get_new_item(item, m):
+    matchups, streaks, schedule = item
+
+    new_matchups = [new_m for new_m in matchups if new_m != m]
+    new_schedule = [s for s in schedule] + [m]
+    new_streaks = streaks.copy()
+
+    update_streaks(m, new_streaks)
+
+    return (new_matchups, new_streaks, new_schedule)
+
+
+# Creates the list of tasks to be executed in parallel
+# Uses BFS to explore the first depth layers of the search tree, like create_task_list in parallel_TTP.cpp
+# The tasks are in the same order as the serial search visits them, so their results can be concatenated
+def create_task_list(n, item, depth):
+    tasks = [item]
+
+    for _ in range(depth):
+        new_tasks = []
+
+        for task in tasks:
+            # Completed schedules are kept as tasks, so they are still handled in the right order
+            if len(task[0]) == 0:
+                new_tasks.append(task)
+                continue
+
+            # For each matchup still possible, push a new task to the list
+            for m in task[0]:
+                if check_constraints(task[2], task[1], n, m):
+                    continue
+                new_tasks.append(get_new_item(task, m))
+
+        tasks = new_tasks
+
+    return tasks
+
+
+# Number of random probes of Knuth's estimator for every task considered by the adaptive split
+ADAPTIVE_PROBES = 200
+
+# Maximum number of tasks of the adaptive split, as a multiple of the number of tasks asked for
+# Knuth's estimator sometimes overestimates small subtrees by a lot, so the split stops here even if a task is above target
+ADAPTIVE_TASK_LIMIT = 4
+
+
+# Creates the list of tasks by splitting the tasks of create_task_list further, until every task is estimated
+# to have fewer nodes than 1/num_tasks of the whole tree, so large subtrees are split deeper than small ones
+# The tasks are estimated with Knuth's estimator, and the largest task is split first by placing every valid matchup
+# Knuth's estimator mostly underestimates the largest subtrees, so the tasks never get larger than those of the depth split
+# Each task keeps the positions of the matchups on its path, so the tasks can be put back in the order the serial
+# search visits them. Returns the tasks and the estimated number of schedules of each task
+def create_adaptive_task_list(n, item, num_tasks, depth, rng=None):
+    rng = rng if rng != None else np.random.default_rng()
+
+    # Heap of the tasks which can be split further, the largest first, and the completed schedules which can't
+    heap = []
+    done = []
+    nodes = 0
+    for i, task in enumerate(create_task_list(n, item, depth)):
+        task_nodes, task_leaves = knuth_estimate(n, task, ADAPTIVE_PROBES, rng)
+        heapq.heappush(heap, (-task_nodes, (i,), task, task_leaves))
+        nodes += task_nodes
+    target = nodes / num_tasks
+
+    while heap and -heap[0][0] > target and len(heap) + len(done) < ADAPTIVE_TASK_LIMIT * num_tasks:
+        _, path, task, leaves = heapq.heappop(heap)
+        if len(task[0]) == 0:
+            done.append((path, task, leaves))
+            continue
+
+        for k, m in enumerate(task[0]):
+            if check_constraints(task[2], task[1], n, m):
+                continue
+            new_task = get_new_item(task, m)
+            new_nodes, new_leaves = knuth_estimate(n, new_task, ADAPTIVE_PROBES, rng)
+            heapq.heappush(heap, (-new_nodes, path + (k,), new_task, new_leaves))
+
+    tasks = sorted(done + [(path, task, leaves) for _, path, task, leaves in heap], key=lambda task: task[0])
+    return [task[1] for task in tasks], [task[2] for task in tasks]
+
+
+# Splits the search tree in tasks at the task depth, by default each task starts after a full round
+# If args.adaptive is provided, the tasks are split further into about args.adaptive tasks of the same estimated size
+# Returns the tasks and their estimated numbers of schedules, if any
+def split_tasks(n, item, args):
+    depth = args.task_depth if args.task_depth != None else n//2
+
+    if args.adaptive != None:
+        return create_adaptive_task_list(n, item, args.adaptive, depth)
+
+    return create_task_list(n, item, depth), None
+
+
+# Prints how well the adaptive split estimated the number of schedules of its tasks
+# The error of the total, the mean absolute error per task and the share of the schedules in the largest task
+def print_split_error(estimates, counts):
+    estimates = np.array(estimates)
+    counts = np.array(counts)
+    total = counts.sum()
+
+    total_error = (estimates.sum() - total) / total if total else 0
+    task_error = np.abs(estimates - counts).sum() / total if total else 0
+    largest = counts.max() / total if total else 0
+
+    print(f"Estimated schedules: {round(estimates.sum())}, error {total_error:.2%}, per task error {task_error:.2%} of the schedules")
+    print(f"Largest task: {largest:.2%} of the schedules, an even split is {1 / len(counts):.2%}")
+
+
+# Generates the path of the partial schedule file of a task
+def generate_part_path(n, args, index):
+    _, _, path = generate_paths(n, args)
+    return path + ".part" + str(index)
+
+
+# Searches the subtree of one task in a worker process
+# Returns the number of schedules found, the first verbose schedules and the counters of the lookahead checks
+def run_task(task):
+    n, index, item, args = task
+    matchups, streaks, schedule = item
+    schedules = []
+
+    # Progress is printed by the main process, and schedules are saved to a separate file per task
+    # The part files are concatenated in task order afterwards, so the result matches a serial run
+    task_args = argparse.Namespace(**vars(args))
+    task_args.count = None
+    task_args.part = index
+
+    if args.save != None:
+        open_writer(n, task_args, mode="w")
+
+    # A worker which is spawned instead of forked doesn't inherit the cache folder
+    set_cache_folder(args.table_cache)
+    reset_count()
+    set_pruning(args.prune)
+    try:
+        search(n, matchups, streaks, schedules, task_args, schedule)
+    finally:
+        close_writer()
+
+    return get_count(), schedules, PRUNE_COUNT
+
+
+# Merges the partial schedule files of all tasks into the schedule file, in task order
+def merge_parts(n, args, num_tasks):
+    _, _, path = generate_paths(n, args)
+
+    with open(path, "ab") as dest:
+        # Appending to a new binary file, so it still needs its header, as in ScheduleWriter
+        if args.format == "bin" and dest.tell() == 0:
+            dest.write(binary_header(n))
+
+        for i in range(num_tasks):
+            part_path = generate_part_path(n, args, i)
+            with open(part_path, "rb") as part:
+                shutil.copyfileobj(part, dest)
+            os.remove(part_path)
+
+
+# Function to generate valid TTP schedules by splitting the search tree in tasks, which are searched by run_tasks
+# The search tree is split into tasks at the given depth, after the (normalized) first round
+# run_tasks(n, tasks, args) returns an iterable of the results of run_task, in task order, e.g. from a pool of processes
+# or the workers of a coordinator, the results are merged in this order, so the output matches a serial run
+def generate_TTP_tasks(n, args, run_tasks):
+    schedules = []
+    matchups = []
+    streaks = {}
+    schedule = []
+
+    # Appended part files are merged into the schedule file, so its folder has to exist
+    if args.save != None and not args.append:
+        init_save(n, args)
+    elif args.save != None:
+        init_folder(n, args)
+
+    generate_matchups(n, matchups)
+    generate_streak_count(n, streaks)
+
+    # Order the first round in the schedule to normalize it, as in generate_normalized_schedules
+    if args.normalize:
+        normalize_first_round(n, matchups, streaks, schedule)
+
+    # The lookahead checks also prune the tasks
+    set_pruning(args.prune)
+
+    # Split the search tree in tasks, by default each task starts after a full round
+    tasks, estimates = split_tasks(n, (matchups, streaks, schedule), args)
+    counts = []
+
+    if args.count != None:
+        print(f"{len(tasks)} tasks to execute.")
+
+    for task_count, task_schedules, task_prune_count in run_tasks(n, tasks, args):
+        previous = get_count()
+        add_count(task_count)
+        counts.append(task_count)
+        add_prune_count(task_prune_count)
+
+        if args.count != None and args.count != 0 and get_count() // args.count > previous // args.count:
+            print("Current schedule count:", get_count())
+            save_count(n, args, prefix="")
+
+        if args.verbose != None:
+            schedules.extend(task_schedules[:args.verbose - len(schedules)])
+
+    if args.save != None:
+        merge_parts(n, args, len(tasks))
+
+    if args.verbose != None:
+        print_schedules(n, schedules)
+
+    if args.count != None and args.verbose == None:
+        print(f"Final schedule count ({n} teams): {get_count()}")
+        save_count(n, args, prefix="")
+
+    if args.count != None and args.prune:
+        print_prune_count()
+
+    if args.count != None and estimates != None:
+        print_split_error(estimates, counts)
+
+    reset_count()
+
+
+# Function to generate valid TTP schedules using a pool of worker processes
+def generate_TTP_parallel(n, args):
+    with Pool(processes=args.parallel) as pool:
+        # imap returns the results in task order, as generate_TTP_tasks needs them
+        def run_tasks(n, tasks, args):
+            return pool.imap(run_task, [(n, i, task, args) for i, task in enumerate(tasks)])
+
+        generate_TTP_tasks(n, args, run_tasks)
@@ -1,6 +1,17 @@
 from TTP import *
 from helper import *
+from parallel_TTP import *
+from TTP_state import *
+from TTP_rounds import *
+from TTP_sampler import *
+from TTP_count import *
+from TTP_symmetry import *
+from TTP_stats import *
+from TTP_iter import *
+from TTP_sweep import *
+from TTP_distributed import *
 import sys
+import os
 import argparse
 import timeit
 
@@ -43,13 +54,99 @@ def validate_arguments(args):
     elif args.random and args.max:
         print("Random and max cannot be used together")
         sys.exit(1)
+    # Check whether a sampler is chosen without random
+    elif args.sampler != "restart" and args.random == None:
+        print("Sampler only works with random")
+        sys.exit(1)
     # Check whether append is provided without save
     elif args.save == None and args.append:
         print("Save and append cannot be used together")
         sys.exit(1)
-    # Not implemented warning for parallel processing
-    elif args.parallel:
-        print("Parallel processing not yet implemented!")
+    # Check if the number of parallel processes is at least 1
+    elif args.parallel != None and args.parallel < 1:
+        print("Parallel must be greater than or equal to 1")
+        sys.exit(1)
+    # Check whether parallel is combined with random or max, which depend on the order schedules are found in
+    elif args.parallel and (args.random or args.max):
+        print("Parallel cannot be used together with random or max")
+        sys.exit(1)
+    # Check if the number of sweep processes is at least 1
+    elif args.sweep != None and args.sweep < 1:
+        print("Sweep must be greater than or equal to 1")
+        sys.exit(1)
+    # Check whether the sweep, which only counts the schedules of each n, is combined with options of a single run
+    elif args.sweep != None and (args.verbose != None or args.save != None or args.max or args.random or args.parallel or args.stats != None or args.checkpoint != None or args.resume):
+        print("Sweep cannot be used together with verbose, save, max, random, parallel, stats, checkpoint or resume")
+        sys.exit(1)
+    # Check whether the coordinator, which splits the search in tasks like parallel, is combined with options which don't split
+    elif args.coordinator != None and (args.parallel or args.random or args.max or args.sweep != None or args.stats != None or args.checkpoint != None or args.resume):
+        print("Coordinator cannot be used together with parallel, random, max, sweep, stats, checkpoint or resume")
+        sys.exit(1)
+    # Check if the address of the coordinator has a port
+    elif args.coordinator != None and not args.coordinator.rpartition(":")[2].isdigit():
+        print("Coordinator must be an address of the form host:port")
+        sys.exit(1)
+    # Check if the worker timeout is greater than the interval of the heartbeats of the workers
+    elif args.worker_timeout <= HEARTBEAT_INTERVAL:
+        print(f"Worker timeout must be greater than {HEARTBEAT_INTERVAL}")
+        sys.exit(1)
+    # Check if the number of adaptive tasks is greater than 0
+    elif args.adaptive != None and args.adaptive <= 0:
+        print("Adaptive must be greater than 0")
+        sys.exit(1)
+    # Check whether the adaptive split is used for a run which is split in tasks
+    elif args.adaptive != None and not (args.parallel or args.coordinator != None):
+        print("Adaptive only works with parallel or coordinator")
+        sys.exit(1)
+    # Check if the task depth is greater than 0
+    elif args.task_depth != None and args.task_depth <= 0:
+        print("Task depth must be greater than 0")
+        sys.exit(1)
+    # Check whether an engine which only counts schedules is asked for the schedules themselves
+    elif args.engine in COUNT_ENGINES and (args.verbose != None or args.save != None or args.max or args.random):
+        print(f"The {args.engine} engine only counts schedules, it cannot be used with verbose, save, max or random")
+        sys.exit(1)
+    # Check whether the lookahead checks are used with the recursive engine, the only engine which runs check_constraints
+    elif args.prune and args.engine != "recursive":
+        print("Prune only works with the recursive engine")
+        sys.exit(1)
+    # Check if the statistics interval is greater than 0
+    elif args.stats != None and args.stats <= 0:
+        print("Stats must be greater than 0")
+        sys.exit(1)
+    # Check whether the statistics are used with the recursive engine in a single process, the only search which records them
+    elif args.stats != None and (args.engine != "recursive" or args.parallel or args.random):
+        print("Stats only work with the recursive engine, without parallel or random")
+        sys.exit(1)
+    # Check whether the memo options are used without the memo engine
+    elif (args.canonical or args.cache_size != None) and args.engine != "memo":
+        print("Canonical and cache size only work with the memo engine (-e memo)")
+        sys.exit(1)
+    # Check if the cache size is greater than 0
+    elif args.cache_size != None and args.cache_size <= 0:
+        print("Cache size must be greater than 0")
+        sys.exit(1)
+    # Check if the checkpoint interval is greater than 0
+    elif args.checkpoint != None and args.checkpoint <= 0:
+        print("Checkpoint must be greater than 0")
+        sys.exit(1)
+    # Check whether checkpoint or resume are used with the stack engine, which keeps the search frontier
+    elif (args.checkpoint != None or args.resume) and args.engine != "stack":
+        print("Checkpoint and resume only work with the stack engine (-e stack)")
+        sys.exit(1)
+    # Check whether checkpoint or resume are combined with random or parallel
+    elif (args.checkpoint != None or args.resume) and (args.random or args.parallel):
+        print("Checkpoint and resume cannot be used together with random or parallel")
+        sys.exit(1)
+    # Check whether resume is used for a single n, with an existing checkpoint of the same kind of run
+    elif args.resume and args.n_start != args.n_end:
+        print("Resume only works for a single number of teams")
+        sys.exit(1)
+    elif args.resume and not os.path.exists(checkpoint_path(args.n_start)):
+        print("No checkpoint found to resume")
+        sys.exit(1)
+    elif args.resume and load_checkpoint(args.n_start)["normalize"] != args.normalize:
+        print("Normalize must be the same as in the checkpointed run")
         sys.exit(1)
 
 
@@ -61,23 +158,54 @@ def parse_arguments():
     parser.add_argument("n_end", type=int, nargs="?", help="Upper bound for range of teams for which schedules should be generated, must be even. If not provided, schedules are generated for n_start only")
     # Optional boolean arguments
     parser.add_argument("-N", "--normalize", action="store_true", help="Generate normalized schedules")
-    parser.add_argument("-p", "--parallel", action="store_true", help="Enable parallel processing (not implemented)") # Not implemented
     parser.add_argument("--append", action="store_true", help="Append schedules to the file instead of overwriting. Only works with --save")
+    parser.add_argument("--resume", action="store_true", help="Resume the run from the last checkpoint. Only works with the stack engine")
     # Optional non-boolean arguments
     parser.add_argument("-v", "--verbose", type=int, help="Prints first VERBOSE rounds of all schedules, possible rounds and matchups")
     parser.add_argument("-c", "--count", type=int, help="Print the count of schedules generated. Every COUNT schedules, the count is printed. Set to 0 to only print the final count")
     parser.add_argument("-m", "--max", type=int, help="Maximum number of schedules to generate")
     parser.add_argument("-s", "--save", type=str, help="Saves the schedules to a given file")
+    parser.add_argument("-f", "--format", type=str, choices=["csv", "bin"], default="csv", help="Format of the saved schedules, text (csv) or rows of uint8 team indices (bin)")
     parser.add_argument("-r", "--random", type=int, help="Generate random schedules by restarting the algorithm with a different initial matchup order each time")
+    parser.add_argument("--sampler", type=str, choices=list(SAMPLERS), default="restart", help="Sampler used for random schedules: restart the search (restart), randomized backtracking with restarts (backtrack) or uniform rejection sampling (uniform)")
     parser.add_argument("-t", "--timer", action="store_true", help="Time the generation of schedules")
+    parser.add_argument("-p", "--parallel", type=int, help="Search the schedules with PARALLEL worker processes")
+    parser.add_argument("--sweep", type=int, help="Count the schedules for all n at once with SWEEP worker processes, the most expensive n first, and save one table of the results")
+    parser.add_argument("-e", "--engine", type=str, choices=list(ENGINES), default="recursive", help="Search engine used to generate the schedules, all engines find the same schedules in the same order")
+    parser.add_argument("--prune", type=str, nargs="+", choices=list(PRUNING_CHECKS), help="Lookahead checks to prune branches which can't be completed: round completability (round) and the order of the remaining opponents (opponents). Only works with the recursive engine")
+    parser.add_argument("--stats", type=float, help="Instrument the search and print its statistics as a JSON line every STATS seconds, and a summary at the end. Only works with the recursive engine")
+    parser.add_argument("--canonical", action="store_true", help="Memo engine: cache states which are the same up to relabelling the teams under one key")
+    parser.add_argument("--cache-size", type=int, help="Memo engine: maximum number of states kept in the cache of subtree counts")
+    parser.add_argument("--table-cache", type=str, help="Folder in which the tables of the engines, such as the round table, are cached between runs. By default they are only kept in memory")
+    parser.add_argument("--checkpoint", type=float, help="Save the search frontier every CHECKPOINT seconds, so the run can be resumed. Only works with the stack engine")
+    parser.add_argument("--coordinator", type=str, help="Listen on the address host:port and hand out the search tasks to workers, started with python TTP_distributed.py host:port")
+    parser.add_argument("--authkey", type=str, help="Key with which the workers authenticate to the coordinator. Read from TTP_AUTHKEY if not given, otherwise a random key is generated and printed")
+    parser.add_argument("--worker-timeout", type=float, default=WORKER_TIMEOUT, help="Number of seconds without a message after which the coordinator hands out the task of a worker again")
+    parser.add_argument("--adaptive", type=int, help="Split the tasks of the task depth further, into about ADAPTIVE tasks of the same estimated size. Only works with parallel or coordinator")
+    parser.add_argument("--task-depth", type=int, help="Number of matchups placed before the search is split into parallel tasks. Defaults to one round (n/2)")
     return parser.parse_args()
 
 
+# Generates the schedules for a given n, using a pool of worker processes if parallel is provided
+# or the workers of the coordinator if one is given
+# The search is instrumented if stats is provided
+def generate(n, args, coordinator=None):
+    if args.stats != None:
+        set_stats(SearchStats(args.stats))
+
+    if coordinator != None:
+        generate_TTP_distributed(n, args, coordinator)
+    elif args.parallel:
+        generate_TTP_parallel(n, args)
+    else:
+        main(n, args)
+
+
 # Times the execution of the TTP algorithm for a given n
-def timer(n, args):
+def timer(n, args, coordinator=None):
     # Running and timing the generation of all Latin Squares of order n
     start_time = timeit.default_timer()
-    main(n, args)
+    generate(n, args, coordinator)
     stop_time = timeit.default_timer()
     runtime = stop_time - start_time
 
@@ -104,16 +232,31 @@ def run():
     # Validate the arguments
     validate_arguments(args)
 
+    # Cache the tables of the engines on disk only if a folder is given
+    set_cache_folder(args.table_cache)
+
+    # Run all n in the range at once if sweep is provided
+    if args.sweep != None:
+        sweep_TTP(args)
+        return
+
+    # Start the coordinator once, so the workers stay connected for all n
+    coordinator = Coordinator(parse_address(args.coordinator), args.authkey, args.worker_timeout) if args.coordinator != None else None
+
     # Run generate_TTP for each n in the range
-    for n in range(args.n_start, args.n_end + 1, 2):
-        print(f"Generating schedules for {n} teams")
-
-        # Measures and prints the time taken for each n, if timer is enabled
-        if args.timer:
-            time = timer(n, args)
-            print(f"Time taken: {time}\n")
-        else:
-            main(n, args)
+    try:
+        for n in range(args.n_start, args.n_end + 1, 2):
+            print(f"Generating schedules for {n} teams")
+
+            # Measures and prints the time taken for each n, if timer is enabled
+            if args.timer:
+                time = timer(n, args, coordinator)
+                print(f"Time taken: {time}\n")
+            else:
+                generate(n, args, coordinator)
+    finally:
+        if coordinator != None:
+            coordinator.close()
 
 
 if __name__ == "__main__":